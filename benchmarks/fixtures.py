@@ -0,0 +1,43 @@
+import os
+import random
+import fitz  # PyMuPDF for PDF generation
+
+# Synthetic publications of increasing length: name -> page count
+FIXTURE_SIZES = {"small": 10, "medium": 100, "large": 300}
+
+_VOCABULARY = (
+    "portfolio duration convexity CAPM beta alpha ESG governance yield curve equity risk premium "
+    "factor momentum value liquidity volatility drawdown hedge derivative option swap credit spread "
+    "inflation monetary policy valuation earnings dividend discount rate asset allocation benchmark "
+    "tracking error Sharpe ratio active management fixed income sovereign corporate emerging markets"
+).split()
+
+
+def _paragraph(rng, words=120):
+    text = " ".join(rng.choice(_VOCABULARY) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def build_fixture(path, pages, seed=0):
+    """Writes a deterministic text-only PDF with the given number of pages."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        body = f"Section {page_number + 1}\n\n" + "\n\n".join(_paragraph(rng) for _ in range(4))
+        page.insert_textbox(fitz.Rect(54, 54, page.rect.width - 54, page.rect.height - 54), body, fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def ensure_fixtures(directory, sizes=FIXTURE_SIZES):
+    """Generates any missing fixture PDFs in directory and returns {name: path}."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for seed, (name, pages) in enumerate(sorted(sizes.items(), key=lambda item: item[1])):
+        path = os.path.join(directory, f"{name}-{pages}p.pdf")
+        if not os.path.exists(path):
+            build_fixture(path, pages, seed=seed)
+        paths[name] = path
+    return paths
@@ -0,0 +1,253 @@
+"""Stage-level benchmark for streamlit/RAG.py.
+
+Runs download, extraction, chunking, embedding, upsert, BM25 indexing and query against
+synthetic PDFs served from a local HTTP server, with an in-memory vector index standing in
+for Pinecone. Each stage reports the peak RSS sampled while it ran (Linux only). Results are
+written as JSON so runs can be compared:
+
+    python benchmarks/rag_benchmark.py --output bench.json
+    python benchmarks/rag_benchmark.py --baseline bench.json
+"""
+import argparse
+import functools
+import http.server
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "streamlit"))
+
+# Keep RAG off the network and out of the working directory before it is imported
+_WORK_DIR = tempfile.mkdtemp(prefix="rag-benchmark-")
+os.environ.setdefault("RAG_VECTOR_BACKEND", "local")
+os.environ.setdefault("RAG_LOCAL_INDEX_DIR", os.path.join(_WORK_DIR, "local_index"))
+os.environ.setdefault("RAG_LEXICAL_INDEX_DIR", os.path.join(_WORK_DIR, "lexical"))
+os.environ.setdefault("RAG_INGEST_REGISTRY", os.path.join(_WORK_DIR, "ingest_registry.json"))
+
+import numpy as np  # noqa: E402
+import RAG  # noqa: E402
+import lexical_index  # noqa: E402
+import query_cache  # noqa: E402
+from fixtures import FIXTURE_SIZES, ensure_fixtures  # noqa: E402
+from vector_store import LocalVectorIndex  # noqa: E402
+
+QUERIES = [
+    "What does the report conclude about duration risk?",
+    "How is the CAPM beta estimated?",
+    "Which ESG governance factors are discussed?",
+    "What is the equity risk premium assumption?",
+]
+
+
+class InMemoryIndex(LocalVectorIndex):
+    """LocalVectorIndex that never touches disk, so upsert timings exclude file I/O.
+
+    flush() still folds pending upserts into the vector matrix, so that cost is part of
+    the upsert stage instead of the first query.
+    """
+
+    def flush(self):
+        with self._lock:
+            for partition in self._partitions.values():
+                partition.consolidate()
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_fixture_server(directory):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _rss_bytes():
+    """Current resident set size, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    """Samples RSS in a background thread while a stage runs, so each stage gets its own peak."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start_bytes = self.peak_bytes = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        rss = _rss_bytes()
+        if rss is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start_bytes = _rss_bytes()
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _time(fn, repeat):
+    timings, result = [], None
+    with RssSampler() as memory:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - start)
+    return timings, result, memory
+
+
+def _summarize(timings, memory, units, unit_name):
+    p50 = statistics.median(timings)
+    grown = memory.peak_bytes - memory.start_bytes if memory.peak_bytes is not None else None
+    return {
+        "runs": len(timings),
+        "p50_seconds": p50,
+        "p95_seconds": _percentile(timings, 0.95),
+        f"{unit_name}": units,
+        f"{unit_name}_per_second": units / p50 if p50 > 0 else None,
+        "peak_rss_bytes": memory.peak_bytes,
+        "peak_rss_growth_bytes": grown,
+    }
+
+
+def benchmark_fixture(name, url, model, repeat):
+    stages = {}
+
+    timings, pdf, memory = _time(lambda: RAG.download_pdf_file(url), repeat)
+    stages["download"] = _summarize(timings, memory, pdf.size, "bytes")
+
+    timings, text, memory = _time(lambda: RAG.extract_clean_text_from_pdf(pdf), repeat)
+    with pdf.open() as doc:
+        stages["extract"] = _summarize(timings, memory, doc.page_count, "pages")
+
+    timings, chunks, memory = _time(lambda: RAG.split_text_into_chunks(text), repeat)
+    stages["split"] = _summarize(timings, memory, len(chunks), "chunks")
+
+    timings, embeddings, memory = _time(lambda: RAG.create_chunk_embeddings(chunks, model), repeat)
+    stages["embed"] = _summarize(timings, memory, len(chunks), "chunks")
+
+    def upsert():
+        # A fresh index per run, so every run inserts new rows instead of overwriting the last run's
+        index = InMemoryIndex(f"bench-{name}", dimension=embeddings.shape[1], directory=os.path.join(_WORK_DIR, name))
+        RAG.upload_chunks_with_metadata(chunks, embeddings, index, pdf.content_hash)
+        return index
+
+    timings, index, memory = _time(upsert, repeat)
+    stages["upsert"] = _summarize(timings, memory, len(chunks), "vectors")
+
+    # The same BM25 index finalize_ingest builds, so scoped queries take the hybrid path
+    chunk_ids = [f"{pdf.content_hash}-chunk-{i}" for i, chunk in enumerate(chunks) if chunk]
+    texts = [chunk for chunk in chunks if chunk]
+    timings, _, memory = _time(lambda: lexical_index.build_document_index(pdf.content_hash, chunk_ids, texts), repeat)
+    stages["lexical_index"] = _summarize(timings, memory, len(texts), "chunks")
+
+    def run_queries():
+        query_cache.result_cache.invalidate()
+        query_cache.embedding_cache.invalidate()
+        for query in QUERIES:
+            RAG.find_best_match(query, index, model, document_ids=pdf.content_hash)
+
+    timings, _, memory = _time(run_queries, repeat)
+    stages["query"] = _summarize([t / len(QUERIES) for t in timings], memory, 1, "queries")
+    pdf.close()
+    return stages
+
+
+def check_ivf_matches_exact(size=2000, dimension=32, queries=20, seed=0):
+    """IVF probing every list (with and without a filter matching every row) must return exact-mode results."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dimension)).astype(np.float32)
+    records = [(f"v{i}", vector, {"document_id": "doc"}) for i, vector in enumerate(vectors)]
+    exact = InMemoryIndex("check-exact", dimension=dimension, directory=os.path.join(_WORK_DIR, "check-exact"), mode="exact")
+    ivf = InMemoryIndex("check-ivf", dimension=dimension, directory=os.path.join(_WORK_DIR, "check-ivf"),
+                        mode="ivf", nprobe=size)
+    exact.upsert(records)
+    ivf.upsert(records)
+    for query in vectors[:queries]:
+        for metadata_filter in (None, {"document_id": {"$eq": "doc"}}):
+            expected = [match["id"] for match in exact.query(query, top_k=5, filter=metadata_filter)["matches"]]
+            actual = [match["id"] for match in ivf.query(query, top_k=5, filter=metadata_filter)["matches"]]
+            if actual != expected:
+                raise AssertionError(f"IVF with full probing returned {actual}, exact search {expected}")
+
+
+def compare(results, baseline):
+    """Prints the p50 ratio of every stage against a previous run."""
+    for fixture, stages in results["fixtures"].items():
+        for stage, stats in stages.items():
+            previous = baseline.get("fixtures", {}).get(fixture, {}).get(stage)
+            if previous and previous["p50_seconds"]:
+                ratio = stats["p50_seconds"] / previous["p50_seconds"]
+                print(f"{fixture:>8} {stage:>13}: {ratio:6.2f}x p50 vs baseline", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", nargs="+", choices=sorted(FIXTURE_SIZES), default=sorted(FIXTURE_SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fixture-dir", default=os.path.join(tempfile.gettempdir(), "rag-benchmark-fixtures"))
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    check_ivf_matches_exact()
+    paths = ensure_fixtures(args.fixture_dir)
+    server = start_fixture_server(args.fixture_dir)
+    model = RAG.load_model()
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "hybrid_retrieval": RAG.HYBRID_RETRIEVAL,
+        "fixtures": {},
+    }
+    try:
+        for name in args.fixtures:
+            url = f"http://127.0.0.1:{server.server_port}/{os.path.basename(paths[name])}"
+            results["fixtures"][name] = benchmark_fixture(name, url, model, args.repeat)
+    finally:
+        server.shutdown()
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
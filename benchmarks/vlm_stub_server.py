@@ -0,0 +1,82 @@
+"""Local stand-in for the NVIDIA VLM endpoint.
+
+Answers every POST with a canned chat completion after an optional delay, and can fail a
+fraction of requests with HTTP 503 to exercise retries. Point the app at it with
+VLM_BASE_URL=http://127.0.0.1:<port>:
+
+    python benchmarks/vlm_stub_server.py --port 8765 --latency 0.2 --failure-rate 0.1
+"""
+import argparse
+import http.server
+import json
+import random
+import threading
+import time
+
+
+class StubVLMServer(http.server.ThreadingHTTPServer):
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, failure_rate=0.0, reply="A bar chart of returns."):
+        super().__init__(address, _StubHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.reply = reply
+        self.requests = 0
+        self.max_concurrent = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection pooling is observable
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server._lock:
+            server.requests += 1
+            server._active += 1
+            server.max_concurrent = max(server.max_concurrent, server._active)
+        try:
+            time.sleep(server.latency)
+            if random.random() < server.failure_rate:
+                self._reply(503, {"error": "stub overloaded"})
+            else:
+                model = self.path.strip("/")
+                self._reply(200, {"model": model, "choices": [{"message": {"role": "assistant", "content": server.reply}}]})
+        finally:
+            with server._lock:
+                server._active -= 1
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StubVLMServer(("127.0.0.1", args.port), args.latency, args.failure_rate)
+    print(f"Stub VLM server listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,20 @@ import os
 import time
 import requests
 import tempfile
-import re
 import fitz  # PyMuPDF for PDF extraction
+import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pinecone import Pinecone, ServerlessSpec
 import sys
 import logging
+import ingest_registry
+import model_registry
+import query_cache
+import lexical_index
+import tracing
+from vector_store import LocalVectorIndex, bulk_upsert, open_local_index
+from pdf_text import extract_page_texts, sanitize_text
 
 # Extend the path for module imports
 sys.path.append('/Users/nishitamatlani/Downloads/Assignment3_Nvidia')
@@ -27,16 +33,47 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_REGION = "us-east-1"
 DEFAULT_INDEX_NAME = "document-embeddings-index"
 
-if not PINECONE_API_KEY:
+# All publications share one long-lived index; chunks carry a document_id metadata field
+SHARED_INDEX_NAME = os.getenv("RAG_INDEX_NAME", DEFAULT_INDEX_NAME)
+
+# Vector store backend: "pinecone" (serverless) or "local" (in-process, memory-mapped)
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "pinecone").lower()
+
+# Embedding configuration
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", 64))
+EMBED_NORMALIZE = os.getenv("RAG_EMBED_NORMALIZE", "false").lower() == "true"
+
+# Hybrid retrieval: share of the fused score given to dense similarity vs. BM25
+HYBRID_RETRIEVAL = os.getenv("RAG_HYBRID_RETRIEVAL", "true").lower() == "true"
+HYBRID_ALPHA = float(os.getenv("RAG_HYBRID_ALPHA", 0.5))
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", 20))
+
+# Optional cross-encoder re-ranking of over-fetched candidates
+RERANK_ENABLED = os.getenv("RAG_RERANK", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", model_registry.DEFAULT_RERANKER_NAME)
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", 20))
+RERANK_BATCH_SIZE = int(os.getenv("RAG_RERANK_BATCH_SIZE", 16))
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", 500))
+
+# PDFs larger than this are spooled to a temporary file instead of held in memory
+PDF_SPOOL_THRESHOLD = int(os.getenv("RAG_PDF_SPOOL_THRESHOLD", 64 * 1024 * 1024))
+PDF_DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+if VECTOR_BACKEND not in ("pinecone", "local"):
+    raise EnvironmentError(f"Unsupported RAG_VECTOR_BACKEND: {VECTOR_BACKEND}")
+
+if VECTOR_BACKEND == "pinecone" and not PINECONE_API_KEY:
     raise EnvironmentError("PINECONE_API_KEY is missing from the environment variables.")
 
-pinecone_client = Pinecone(api_key=PINECONE_API_KEY)
+pinecone_client = Pinecone(api_key=PINECONE_API_KEY) if VECTOR_BACKEND == "pinecone" else None
 _index_cache = {}
 
-# Function to initialize or connect to a Pinecone index
+# Function to initialize or connect to an index on the configured backend
 def connect_or_create_index(index_name, dimension=384, metric='cosine'):
     if index_name in _index_cache:
         logging.info(f"Using cached index: {index_name}")
+    elif VECTOR_BACKEND == "local":
+        _index_cache[index_name] = open_local_index(index_name, dimension=dimension, metric=metric)
     else:
         existing_indexes = [idx.name for idx in pinecone_client.list_indexes()]
         if index_name not in existing_indexes:
@@ -51,58 +88,135 @@ def connect_or_create_index(index_name, dimension=384, metric='cosine'):
         _index_cache[index_name] = pinecone_client.Index(index_name)
     return _index_cache[index_name]
 
-# Function to load a sentence transformer model securely
-def load_model(model_type='sentence-transformers'):
+# Function to fetch the shared sentence transformer model, loading it once per process
+def load_model(model_type='sentence-transformers', device=None):
     try:
         if model_type == 'sentence-transformers':
-            return SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+            return model_registry.get_model(model_registry.DEFAULT_MODEL_NAME, device=device)
         else:
             raise ValueError("Invalid model type. Only 'sentence-transformers' is supported.")
     except Exception as e:
         logging.error(f"Model loading failed: {e}")
         raise
 
-def create_chunk_embeddings(chunks, model):
-    """Encodes chunks into embeddings with error handling."""
+def create_chunk_embeddings(chunks, model, batch_size=EMBED_BATCH_SIZE, normalize=EMBED_NORMALIZE):
+    """Encodes chunks in batches into one contiguous float32 matrix of shape (len(chunks), dim)."""
+    dimension = model.get_sentence_embedding_dimension()
+    embeddings = np.empty((len(chunks), dimension), dtype=np.float32)
     try:
-        return [model.encode(chunk).tolist() for chunk in chunks]
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            embeddings[start:start + len(batch)] = model.encode(
+                batch,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=normalize,
+                show_progress_bar=False,
+            )
+        return embeddings
     except Exception as e:
         logging.error(f"Failed to create embeddings: {e}")
-        return []
+        return np.empty((0, dimension), dtype=np.float32)
+
+class DownloadedPdf:
+    """PDF fetched in one streaming pass: its MD5 hash plus the bytes in memory or a spool file."""
+
+    def __init__(self, content_hash, size, data=None, path=None, fingerprint=None):
+        self.content_hash = content_hash
+        self.size = size
+        self.data = data
+        self.path = path
+        self.fingerprint = fingerprint  # response validators recorded with the source URL
 
-def generate_index_name_from_file(file_path):
-    """Generates a unique index name based on file hash."""
+    @property
+    def source(self):
+        """The in-memory bytes, or the spool file path for large downloads."""
+        return self.data if self.data is not None else self.path
+
+    def open(self):
+        """Opens the PDF with PyMuPDF without another copy of the bytes."""
+        if self.data is not None:
+            return fitz.open(stream=self.data, filetype="pdf")
+        return fitz.open(self.path)
+
+    def close(self):
+        """Releases the buffer and removes the spool file, if any."""
+        self.data = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Size alone cannot tell a replaced object from the original, so sources without validators get no fingerprint
+def _response_fingerprint(headers, size):
+    etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return None
+    return {"etag": etag, "last_modified": last_modified, "size": size}
+
+# Fetch only the validators of a source: a one-byte ranged GET works for presigned URLs, which reject HEAD
+def source_fingerprint(url):
     try:
-        with open(file_path, "rb") as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
-        index_name = f"index-{file_hash[:8]}"
-        return re.sub(r'[^a-z0-9-]', '-', index_name)
-    except Exception as e:
-        logging.error(f"Error generating index name: {e}")
-        raise
+        with requests.get(url, timeout=10, stream=True, headers={"Range": "bytes=0-0"}) as response:
+            response.raise_for_status()
+            content_range = response.headers.get("Content-Range", "")
+            if response.status_code == 206 and "/" in content_range:
+                size = content_range.rsplit("/", 1)[1]
+            else:
+                size = response.headers.get("Content-Length")
+            if not size or not size.isdigit():
+                return None
+            return _response_fingerprint(response.headers, int(size))
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Could not validate cached source {url}: {e}")
+        return None
 
-# Redesigned function to download and verify PDF content
-def download_pdf_file(url):
+# Stream the PDF once, hashing bytes as they arrive and spooling to disk only above the threshold
+def download_pdf_file(url, spool_threshold=PDF_SPOOL_THRESHOLD):
+    digest = hashlib.md5()
+    buffer = bytearray()
+    spool = None
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-            temp_pdf.write(response.content)
-        logging.info(f"PDF downloaded successfully to {temp_pdf.name}")
-        return temp_pdf.name
+        with requests.get(url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            headers = response.headers
+            for chunk in response.iter_content(chunk_size=PDF_DOWNLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                if spool is None and len(buffer) + len(chunk) > spool_threshold:
+                    spool = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+                    spool.write(buffer)
+                    buffer = bytearray()
+                if spool is not None:
+                    spool.write(chunk)
+                else:
+                    buffer.extend(chunk)
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to download PDF: {e}")
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
         raise ValueError("Unable to download PDF. Please verify the URL.")
 
+    if spool is not None:
+        size = spool.tell()
+        spool.close()
+        logging.info(f"PDF downloaded successfully ({size} bytes, spooled to {spool.name})")
+        return DownloadedPdf(digest.hexdigest(), size, path=spool.name,
+                             fingerprint=_response_fingerprint(headers, size))
+    logging.info(f"PDF downloaded successfully ({len(buffer)} bytes)")
+    return DownloadedPdf(digest.hexdigest(), len(buffer), data=buffer,
+                         fingerprint=_response_fingerprint(headers, len(buffer)))
+
 # Extract text using PyMuPDF with added checks for text extraction
-def extract_clean_text_from_pdf(pdf_path):
-    text_content = []
+def extract_clean_text_from_pdf(pdf_source):
     try:
-        with fitz.open(pdf_path) as pdf:
-            for page_number in range(pdf.page_count):
-                page_text = sanitize_text(pdf[page_number].get_text())
-                if page_text:
-                    text_content.append(page_text)
+        source = pdf_source.source if isinstance(pdf_source, DownloadedPdf) else pdf_source
+        text_content = [page_text for page_text in extract_page_texts(source) if page_text]
         logging.info(f"Extracted text from {len(text_content)} pages.")
         return ' '.join(text_content)
     except Exception as e:
@@ -113,46 +227,210 @@ def split_text_into_chunks(text, max_length=600, overlap=50):
     splitter = RecursiveCharacterTextSplitter(chunk_size=max_length, chunk_overlap=overlap)
     return [sanitize_text(chunk) for chunk in splitter.split_text(text)]
 
-def upload_chunks_with_metadata(chunks, embeddings, pinecone_index):
-    if not chunks or not embeddings:
+def upload_chunks_with_metadata(chunks, embeddings, pinecone_index, document_id=None, start_index=0, flush=True):
+    if not chunks or len(embeddings) == 0:
         logging.warning("No chunks or embeddings to upload.")
-        return
+        return 0
 
+    # Chunk ids are prefixed with the document id so documents can share one index
+    id_prefix = f"{document_id}-" if document_id else ""
+    metadata = {"document_id": document_id} if document_id else {}
+    # Embeddings stay a NumPy matrix until here; the vector store expects plain lists
     data_records = [
-        {"id": f"chunk-{i}", "values": embedding, "metadata": {"content": chunk}}
-        for i, (embedding, chunk) in enumerate(zip(embeddings, chunks)) if embedding and chunk
+        {"id": f"{id_prefix}chunk-{i}", "values": embedding.tolist(), "metadata": {**metadata, "content": chunk}}
+        for i, (embedding, chunk) in enumerate(zip(embeddings, chunks), start_index) if chunk
     ]
     if data_records:
-        logging.info(f"Uploading {len(data_records)} chunks to Pinecone index.")
-        pinecone_index.upsert(vectors=data_records)
+        logging.info(f"Uploading {len(data_records)} chunks to {VECTOR_BACKEND} index.")
+        bulk_upsert(pinecone_index, data_records)
+        if flush and isinstance(pinecone_index, LocalVectorIndex):
+            pinecone_index.flush()
+    return len(data_records)
+
+def document_filter(document_ids):
+    """Builds the metadata filter restricting a query to the given documents (None searches all)."""
+    if not document_ids:
+        return None
+    if isinstance(document_ids, str):
+        return {"document_id": {"$eq": document_ids}}
+    return {"document_id": {"$in": list(document_ids)}}
+
+def embed_query(query, model):
+    """Encodes a query, reusing cached vectors for repeated questions."""
+    normalized = query_cache.normalize_query(query)
+    key = (id(model), normalized)
+    with tracing.span("embed_query") as span:
+        query_vector = query_cache.embedding_cache.get(key)
+        span.set(cache_hit=query_vector is not None)
+        if query_vector is None:
+            query_vector = model.encode(normalized).tolist()
+            query_cache.embedding_cache.put(key, query_vector)
+    return query_vector
 
-def sanitize_text(text):
-    return re.sub(r'[^\x00-\x7F]+', ' ', text).replace('\n', ' ').strip()
+def _min_max(scores):
+    low, high = min(scores, default=0.0), max(scores, default=0.0)
+    return [1.0 if high == low else (score - low) / (high - low) for score in scores]
 
-# Query the index and return answers
-def find_best_match(query, index, model):
+def fuse_matches(dense_matches, lexical_matches, alpha=HYBRID_ALPHA, top_k=3):
+    """Combines min-max normalized dense and BM25 scores as alpha * dense + (1 - alpha) * bm25."""
+    fused = {}
+    for match, score in zip(dense_matches, _min_max([match["score"] for match in dense_matches])):
+        fused[match["id"]] = dict(match, score=alpha * score)
+    for (chunk_id, _, text), score in zip(lexical_matches, _min_max([match[1] for match in lexical_matches])):
+        entry = fused.setdefault(chunk_id, {"id": chunk_id, "score": 0.0, "content": text.strip()})
+        entry["score"] += (1 - alpha) * score
+    return sorted(fused.values(), key=lambda match: -match["score"])[:top_k]
+
+def _dense_matches(query, index, model, document_ids, top_k):
     try:
-        query_vector = model.encode(query).tolist()
-        results = index.query(vector=query_vector, top_k=3, include_metadata=True)
-        if results and "matches" in results:
-            return "\n\n".join(
-                match.get("metadata", {}).get("content", "").strip()
-                for match in results["matches"] if match.get("metadata", {}).get("content", "")
-            ) or "No relevant answer found."
+        query_vector = embed_query(query, model)
+        with tracing.span("dense_search", top_k=top_k):
+            results = index.query(
+                vector=query_vector, top_k=top_k, include_metadata=True, filter=document_filter(document_ids)
+            )
     except Exception as e:
         logging.error(f"Error during query: {e}")
-    return "No matches found."
+        return None
+    if not results or "matches" not in results:
+        return None
+    return [
+        {"id": match.get("id"), "score": match.get("score"), "content": match.get("metadata", {}).get("content", "").strip()}
+        for match in results["matches"] if match.get("metadata", {}).get("content", "")
+    ]
+
+def rerank_matches(query, matches, top_k=3, batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS):
+    """Re-scores candidates with the cross-encoder in batches and keeps the best top_k.
+
+    If scoring runs past budget_ms, the remaining batches are skipped and the first-stage
+    ranking is returned unchanged.
+    """
+    if len(matches) <= 1:
+        return matches[:top_k]
+    reranker = model_registry.get_cross_encoder(RERANK_MODEL)
+    start = time.perf_counter()
+    scores = []
+    for batch_start in range(0, len(matches), batch_size):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > budget_ms:
+            logging.warning(f"Re-ranking exceeded {budget_ms:.0f} ms budget after {len(scores)} candidates; bypassing")
+            return matches[:top_k]
+        batch = matches[batch_start:batch_start + batch_size]
+        scores.extend(reranker.predict(
+            [(query, match["content"]) for match in batch], batch_size=batch_size, show_progress_bar=False
+        ))
+    order = sorted(range(len(matches)), key=lambda i: -scores[i])[:top_k]
+    return [dict(matches[i], rerank_score=float(scores[i])) for i in order]
+
+# Query the index and return the top matches as (id, score, content) dicts; None on failure
+def retrieve_matches(query, index, model, document_ids=None, top_k=3):
+    with tracing.span("query", top_k=top_k) as span:
+        key = query_cache.result_key(document_ids, query, top_k)
+        matches = query_cache.result_cache.get(key)
+        span.set(cache_hit=matches is not None)
+        if matches is None:
+            matches = _retrieve_uncached(query, index, model, document_ids, top_k)
+            if matches is not None:
+                query_cache.result_cache.put(key, matches)
+        span.set(matches=len(matches) if matches is not None else 0)
+    return matches
+
+def _retrieve_uncached(query, index, model, document_ids, top_k):
+    # With re-ranking on, the first stage over-fetches candidates for the cross-encoder
+    candidate_k = max(top_k, RERANK_CANDIDATES) if RERANK_ENABLED else top_k
+    scoped_ids = [document_ids] if isinstance(document_ids, str) else document_ids
+    if HYBRID_RETRIEVAL and scoped_ids:
+        # Lexical search needs the per-document BM25 indexes, so it only runs for scoped queries
+        with tracing.span("lexical_search") as span:
+            lexical = lexical_index.search_documents(query, scoped_ids, max(candidate_k, HYBRID_CANDIDATES))
+            span.set(matches=len(lexical))
+        dense = _dense_matches(query, index, model, document_ids, max(candidate_k, HYBRID_CANDIDATES))
+        if dense is None and not lexical:
+            return None
+        matches = fuse_matches(dense or [], lexical, HYBRID_ALPHA, candidate_k)
+    else:
+        matches = _dense_matches(query, index, model, document_ids, candidate_k)
+        if matches is None:
+            return None
+    if RERANK_ENABLED:
+        with tracing.span("rerank", candidates=len(matches)) as span:
+            matches = rerank_matches(query, matches, top_k)
+            span.set(bypassed=bool(matches) and "rerank_score" not in matches[0])
+    return matches
+
+# Query the index and return answers, optionally restricted to some documents
+def find_best_match(query, index, model, document_ids=None, top_k=3):
+    matches = retrieve_matches(query, index, model, document_ids, top_k)
+    if matches is None:
+        return "No matches found."
+    return "\n\n".join(match["content"] for match in matches) or "No relevant answer found."
+
+# Build the lexical index, drop stale cached answers and record the document as fully indexed
+def finalize_ingest(document_id, text_chunks, uploaded, pdf_url, source_fingerprint=None):
+    with tracing.span("lexical_index"):
+        lexical_index.build_document_index(
+            document_id,
+            [f"{document_id}-chunk-{i}" for i, chunk in enumerate(text_chunks) if chunk],
+            [chunk for chunk in text_chunks if chunk],
+        )
+    query_cache.invalidate_document(document_id)
+    ingest_registry.mark_indexed(document_id, SHARED_INDEX_NAME, uploaded, pdf_url, VECTOR_BACKEND, source_fingerprint)
+
+def _is_shared_index_entry(entry):
+    # Entries from the old one-index-per-PDF layout lack document_id metadata and are re-ingested
+    return entry is not None and entry["index_name"] == SHARED_INDEX_NAME
+
+# Download, extract, embed and upsert a PDF unless the ingest registry already has it.
+# Returns the shared index and the document id to filter queries with.
+def ingest_pdf(pdf_url, model):
+    with tracing.span("ingest") as ingest_span:
+        entry = ingest_registry.lookup_source(pdf_url, VECTOR_BACKEND, source_fingerprint(pdf_url))
+        if _is_shared_index_entry(entry):
+            logging.info(f"Ingest cache hit for {ingest_registry.normalize_source_url(pdf_url)}")
+            ingest_span.set(cache_hit=True)
+            return connect_or_create_index(SHARED_INDEX_NAME), entry["content_hash"]
+
+        with tracing.span("download") as span:
+            pdf = download_pdf_file(pdf_url)
+            span.set(bytes=pdf.size)
+        try:
+            document_id = pdf.content_hash
+            entry = ingest_registry.lookup_document(document_id, VECTOR_BACKEND)
+            ingest_span.set(cache_hit=_is_shared_index_entry(entry))
+            if _is_shared_index_entry(entry):
+                logging.info(f"Ingest cache hit for document {document_id[:8]}")
+                ingest_registry.mark_indexed(
+                    document_id, SHARED_INDEX_NAME, entry["chunk_count"], pdf_url, VECTOR_BACKEND, pdf.fingerprint
+                )
+                return connect_or_create_index(SHARED_INDEX_NAME), document_id
+
+            with tracing.span("extract") as span:
+                raw_text = extract_clean_text_from_pdf(pdf)
+                span.set(chars=len(raw_text))
+            with tracing.span("split") as span:
+                text_chunks = split_text_into_chunks(raw_text)
+                span.set(chunks=len(text_chunks))
+            with tracing.span("embed", chunks=len(text_chunks)):
+                chunk_embeddings = create_chunk_embeddings(text_chunks, model)
+            with tracing.span("connect_index"):
+                pinecone_index = connect_or_create_index(SHARED_INDEX_NAME)
+            with tracing.span("upsert") as span:
+                uploaded = upload_chunks_with_metadata(text_chunks, chunk_embeddings, pinecone_index, document_id)
+                span.set(vectors=uploaded)
+            if uploaded:
+                finalize_ingest(document_id, text_chunks, uploaded, pdf_url, pdf.fingerprint)
+            return pinecone_index, document_id
+        finally:
+            pdf.close()
+
+# Full RAG process with modular design; pass a tracing.Trace to collect per-stage timings
+def run_rag_pipeline(pdf_url, user_query, model_type='sentence-transformers', trace=None):
+    with tracing.activate(trace if trace is not None else tracing.Trace()):
+        with tracing.span("load_model"):
+            model = load_model(model_type)
+        pinecone_index, document_id = ingest_pdf(pdf_url, model)
+        return find_best_match(user_query, pinecone_index, model, document_ids=document_id)
 
-# Full RAG process with modular design
-def run_rag_pipeline(pdf_url, user_query, model_type='sentence-transformers'):
-    pdf_path = download_pdf_file(pdf_url)
-    raw_text = extract_clean_text_from_pdf(pdf_path)
-    text_chunks = split_text_into_chunks(raw_text)
+# Answer a question across every publication ingested into the shared index
+def search_library(user_query, document_ids=None, top_k=3, model_type='sentence-transformers'):
     model = load_model(model_type)
-    chunk_embeddings = create_chunk_embeddings(text_chunks, model)
-    index_name = generate_index_name_from_file(pdf_path)
-    pinecone_index = connect_or_create_index(index_name)
-    upload_chunks_with_metadata(text_chunks, chunk_embeddings, pinecone_index)
-    answer = find_best_match(user_query, pinecone_index, model)
-    os.remove(pdf_path)
-    return answer
+    return find_best_match(user_query, connect_or_create_index(SHARED_INDEX_NAME), model, document_ids, top_k)
@@ -9,6 +9,8 @@ import boto3
 import tempfile
 from langchain_community.document_loaders import PyPDFLoader
 from RAG import run_rag_pipeline  # Correctly import your own module, assuming it's in the same directory
+from rag_async import run_rag_pipeline_concurrent
+from tracing import Trace
 import snowflake.connector
 import pinecone
 
@@ -17,6 +19,9 @@ import pinecone
 # Load environment variables from the .env file
 load_dotenv()
 
+# Overlap download, extraction, embedding and upsert when answering questions
+RAG_ASYNC_PIPELINE = os.getenv("RAG_ASYNC_PIPELINE", "false").lower() == "true"
+
 # FastAPI backend URL from .env file
 FASTAPI_URL = os.getenv("FASTAPI_URL", "http://127.0.0.1:8000")  # Default to localhost if not found
 
@@ -295,11 +300,16 @@ def show_pdf_qna_page():
         )
 
         user_query = st.text_input("Enter your question:")
+        show_timings = st.checkbox("Show timing breakdown")
         
         if st.button("Get Answer"):
             if user_query:
-                answer = run_rag_pipeline(pdf_url, user_query)  # Use the generated PDF link and user query
+                trace = Trace()
+                rag_pipeline = run_rag_pipeline_concurrent if RAG_ASYNC_PIPELINE else run_rag_pipeline
+                answer = rag_pipeline(pdf_url, user_query, trace=trace)  # Use the generated PDF link and user query
                 st.write("Answer:", answer)
+                if show_timings:
+                    st.table(trace.as_rows())
             else:
                 st.warning("Please enter a question.")
 
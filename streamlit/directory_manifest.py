@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import logging
+from llama_index.core import Document
+from file_utils import atomic_write_json
+
+# Per-directory manifests and the Documents cached for every file they list
+MANIFEST_DIR = os.getenv("INGEST_MANIFEST_DIR", os.path.join(os.getcwd(), "vectorstore", "directory_manifests"))
+
+
+def _directory_key(directory):
+    return hashlib.sha256(os.path.abspath(directory).encode("utf-8")).hexdigest()[:16]
+
+
+def manifest_path(directory):
+    return os.path.join(MANIFEST_DIR, f"{_directory_key(directory)}.json")
+
+
+def _documents_path(directory, filename, content_hash):
+    key = hashlib.sha256(f"{filename}\0{content_hash}".encode("utf-8")).hexdigest()
+    return os.path.join(MANIFEST_DIR, _directory_key(directory), f"{key}.json")
+
+
+def load_manifest(directory):
+    """Returns {filename: {"size", "mtime", "content_hash", "doc_ids"}} from the last sync of directory."""
+    try:
+        with open(manifest_path(directory), "r", encoding="utf-8") as f:
+            return json.load(f)["files"]
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Ignoring unreadable manifest for {directory}: {e}")
+        return {}
+
+
+def save_manifest(directory, files):
+    atomic_write_json(manifest_path(directory), {"directory": os.path.abspath(directory), "files": files})
+
+
+def is_unchanged(entry, stat):
+    """Cheap check on size and mtime; callers fall back to the content hash when it fails."""
+    return entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+
+def load_documents(directory, filename, content_hash):
+    """Returns the cached Documents of a file version, or None if they are missing."""
+    try:
+        with open(_documents_path(directory, filename, content_hash), "r", encoding="utf-8") as f:
+            return [Document.from_dict(doc) for doc in json.load(f)]
+    except (OSError, ValueError) as e:
+        logging.warning(f"Cached documents for {filename} unavailable, reprocessing: {e}")
+        return None
+
+
+def save_documents(directory, filename, content_hash, documents):
+    atomic_write_json(_documents_path(directory, filename, content_hash), [doc.to_dict() for doc in documents])
+
+
+def drop_documents(directory, filename, content_hash):
+    try:
+        os.remove(_documents_path(directory, filename, content_hash))
+    except FileNotFoundError:
+        pass
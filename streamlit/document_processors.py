@@ -14,86 +14,199 @@
 # limitations under the License.
 
 import os
+import hashlib
 import fitz
 from pptx import Presentation
-import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from llama_index.core import Document
+import directory_manifest
+import vlm_client
+from file_utils import atomic_write_bytes, file_hash
+from table_store import TableWriter, document_key, put_blob
+from ppt_conversion import convert_ppt_to_pdf, convert_ppts_to_pdf, convert_pdf_to_images, queue_ppt_conversions
 from utils import (
-    describe_image, is_graph, process_graph, extract_text_around_item, 
-    process_text_blocks, save_uploaded_file
+    describe_image, describe_graphs, process_graph, extract_text_around_item, 
+    process_text_blocks, save_uploaded_file, TextBlockIndex
 )
 
-def get_pdf_documents(pdf_file):
+# Parallel page processing configuration
+PDF_PAGE_WORKERS = int(os.getenv("PDF_PAGE_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 16))
+# Pages submitted ahead of the one being yielded by iter_pdf_documents
+PDF_PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", 2 * PDF_PAGE_WORKERS))
+
+# Pages without enough ruled horizontal and vertical segments cannot hold a lines_strict table
+TABLE_PREFILTER = os.getenv("TABLE_PREFILTER", "true").lower() in ("1", "true", "yes")
+TABLE_MIN_RULES = int(os.getenv("TABLE_MIN_RULES", 2))
+table_page_stats = {"pages_checked": 0, "pages_skipped": 0}
+
+# Set once per worker process by the pool initializer
+_worker_pdf = None
+_worker_filename = None
+_worker_document_key = None
+_worker_images = None
+
+def get_pdf_documents(pdf_file, workers=PDF_PAGE_WORKERS, min_pages=PDF_PARALLEL_MIN_PAGES):
     """Process a PDF file and extract text, tables, and images."""
-    all_pdf_documents = []
+    return list(iter_pdf_documents(pdf_file, workers, min_pages))
+
+def iter_pdf_documents(pdf_file, workers=PDF_PAGE_WORKERS, min_pages=PDF_PARALLEL_MIN_PAGES, window=PDF_PAGE_WINDOW):
+    """Yield the documents of a PDF file page by page, in page order, as they are extracted.
+
+    In parallel mode at most `window` pages are in flight, so memory stays bounded when the
+    consumer is slower than extraction. Tables are written to the table store once the last
+    page has been extracted, before its documents are yielded; a run stopped early writes
+    nothing, so it never replaces a complete table file with a partial one.
+    """
     ongoing_tables = {}
+    seen_images = {}
 
     try:
-        f = fitz.open(stream=pdf_file.read(), filetype="pdf")
+        pdf_bytes = pdf_file.read()
+        f = fitz.open(stream=pdf_bytes, filetype="pdf")
     except Exception as e:
         print(f"Error opening or processing the PDF file: {e}")
-        return []
+        return
 
-    for i in range(len(f)):
-        page = f[i]
-        text_blocks = [block for block in page.get_text("blocks", sort=True) 
-                       if block[-1] == 0 and not (block[1] < page.rect.height * 0.1 or block[3] > page.rect.height * 0.9)]
-        grouped_text_blocks = process_text_blocks(text_blocks)
-        
-        table_docs, table_bboxes, ongoing_tables = parse_all_tables(pdf_file.name, page, i, text_blocks, ongoing_tables)
-        all_pdf_documents.extend(table_docs)
-
-        image_docs = parse_all_images(pdf_file.name, page, i, text_blocks)
-        all_pdf_documents.extend(image_docs)
-
-        for text_block_ctr, (heading_block, content) in enumerate(grouped_text_blocks, 1):
-            heading_bbox = fitz.Rect(heading_block[:4])
-            if not any(heading_bbox.intersects(table_bbox) for table_bbox in table_bboxes):
-                bbox = {"x1": heading_block[0], "y1": heading_block[1], "x2": heading_block[2], "x3": heading_block[3]}
-                text_doc = Document(
-                    text=f"{heading_block[4]}\n{content}",
-                    metadata={
-                        **bbox,
-                        "type": "text",
-                        "page_num": i,
-                        "source": f"{pdf_file.name[:-4]}-page{i}-block{text_block_ctr}"
-                    },
-                    id_=f"{pdf_file.name[:-4]}-page{i}-block{text_block_ctr}"
-                )
-                all_pdf_documents.append(text_doc)
-
-    f.close()
-    return all_pdf_documents
-
-def parse_all_tables(filename, page, pagenum, text_blocks, ongoing_tables):
-    """Extract tables from a PDF page."""
+    table_writer = TableWriter(document_key(pdf_bytes))
+    try:
+        if workers > 1 and len(f) >= min_pages:
+            page_count = len(f)
+            f.close()
+            first_images = {}
+            # Workers reopen the document from the same bytes, passed once through the initializer
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker,
+                                     initargs=(pdf_bytes, pdf_file.name, table_writer.key, workers)) as executor:
+                in_flight = deque()
+                for pagenum in range(page_count):
+                    in_flight.append(executor.submit(_process_page_in_worker, pagenum))
+                    if len(in_flight) >= max(window, workers):
+                        yield from _collect_page(in_flight.popleft(), table_writer, first_images)
+                while in_flight:
+                    page_docs = _collect_page(in_flight.popleft(), table_writer, first_images)
+                    if not in_flight:
+                        table_writer.close()
+                    yield from page_docs
+            return
+
+        for i in range(len(f)):
+            page_docs, ongoing_tables = process_pdf_page(pdf_file.name, f[i], i, ongoing_tables, table_writer, seen_images)
+            if i == len(f) - 1:
+                table_writer.close()
+            yield from page_docs
+    finally:
+        if not f.is_closed:
+            f.close()
+
+def _collect_page(future, table_writer, first_images):
+    page_docs, pending_tables, page_repeats, page_table_stats = future.result()
+    table_writer.extend(pending_tables)
+    for key, count in page_table_stats.items():
+        table_page_stats[key] += count
+    # Each worker only deduplicates its own pages, so merge repeats found by different workers
+    return merge_duplicate_images(page_docs, page_repeats, first_images)
+
+def _init_page_worker(pdf_bytes, filename, key, workers):
+    global _worker_pdf, _worker_filename, _worker_document_key, _worker_images
+    # Workers together stay within the VLM concurrency and rate limits of a single process
+    vlm_client.share_budget(workers)
+    _worker_pdf = fitz.open(stream=pdf_bytes, filetype="pdf")
+    _worker_filename = filename
+    _worker_document_key = key
+    _worker_images = {}
+
+def _process_page_in_worker(pagenum):
+    # Tables are buffered per page and written by the parent's TableWriter
+    table_writer = TableWriter(_worker_document_key)
+    stats_before = dict(table_page_stats)
+    page_docs, _ = process_pdf_page(_worker_filename, _worker_pdf[pagenum], pagenum, {}, table_writer, _worker_images)
+    # Documents already sent to the parent are copies, so page references to them are sent separately
+    page_repeats = _worker_images.pop("repeats", [])
+    page_table_stats = {key: table_page_stats[key] - stats_before[key] for key in table_page_stats}
+    return page_docs, table_writer.pending, page_repeats, page_table_stats
+
+def process_pdf_page(filename, page, i, ongoing_tables, table_writer, seen_images):
+    """Extract the table, image and text documents of a single PDF page."""
+    page_documents = []
+    text_blocks = [block for block in page.get_text("blocks", sort=True) 
+                   if block[-1] == 0 and not (block[1] < page.rect.height * 0.1 or block[3] > page.rect.height * 0.9)]
+    grouped_text_blocks = process_text_blocks(text_blocks)
+    # Built once per page and shared by every table and image caption lookup
+    block_index = TextBlockIndex(text_blocks)
+    
+    table_docs, table_bboxes, ongoing_tables = parse_all_tables(filename, page, i, block_index, ongoing_tables, table_writer)
+    page_documents.extend(table_docs)
+
+    image_docs = parse_all_images(filename, page, i, block_index, seen_images)
+    page_documents.extend(image_docs)
+
+    for text_block_ctr, (heading_block, content) in enumerate(grouped_text_blocks, 1):
+        heading_bbox = fitz.Rect(heading_block[:4])
+        if not any(heading_bbox.intersects(table_bbox) for table_bbox in table_bboxes):
+            bbox = {"x1": heading_block[0], "y1": heading_block[1], "x2": heading_block[2], "x3": heading_block[3]}
+            text_doc = Document(
+                text=f"{heading_block[4]}\n{content}",
+                metadata={
+                    **bbox,
+                    "type": "text",
+                    "page_num": i,
+                    "source": f"{filename[:-4]}-page{i}-block{text_block_ctr}"
+                },
+                id_=f"{filename[:-4]}-page{i}-block{text_block_ctr}"
+            )
+            page_documents.append(text_doc)
+    return page_documents, ongoing_tables
+
+def page_may_contain_table(page, min_rules=TABLE_MIN_RULES):
+    """Cheap check on the page's vector drawings: lines_strict tables need ruled horizontal and vertical segments."""
+    horizontal = vertical = 0
+    for drawing in page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.y - end.y) <= 1 and abs(start.x - end.x) > 1:
+                    horizontal += 1
+                elif abs(start.x - end.x) <= 1 and abs(start.y - end.y) > 1:
+                    vertical += 1
+            elif item[0] in ("re", "qu"):
+                horizontal += 2
+                vertical += 2
+        if horizontal >= min_rules and vertical >= min_rules:
+            return True
+    return False
+
+def parse_all_tables(filename, page, pagenum, block_index, ongoing_tables, table_writer):
+    """Extract tables from a PDF page into the document's table store."""
     table_docs = []
     table_bboxes = []
+    table_page_stats["pages_checked"] += 1
     try:
+        if TABLE_PREFILTER and not page_may_contain_table(page):
+            table_page_stats["pages_skipped"] += 1
+            return table_docs, table_bboxes, ongoing_tables
         tables = page.find_tables(horizontal_strategy="lines_strict", vertical_strategy="lines_strict")
         for tab in tables:
             if not tab.header.external:
                 pandas_df = tab.to_pandas()
-                tablerefdir = os.path.join(os.getcwd(), "vectorstore/table_references")
-                os.makedirs(tablerefdir, exist_ok=True)
-                df_xlsx_path = os.path.join(tablerefdir, f"table{len(table_docs)+1}-page{pagenum}.xlsx")
-                pandas_df.to_excel(df_xlsx_path)
+                table_id = f"page{pagenum}-table{len(table_docs)+1}"
+                table_path = table_writer.add(table_id, pandas_df, pagenum)
                 bbox = fitz.Rect(tab.bbox)
                 table_bboxes.append(bbox)
 
-                before_text, after_text = extract_text_around_item(text_blocks, bbox, page.rect.height)
+                before_text, after_text = extract_text_around_item(block_index, bbox, page.rect.height)
 
-                table_img = page.get_pixmap(clip=bbox)
-                table_img_path = os.path.join(tablerefdir, f"table{len(table_docs)+1}-page{pagenum}.jpg")
-                table_img.save(table_img_path)
-                description = process_graph(table_img.tobytes())
+                table_img_bytes = page.get_pixmap(clip=bbox).tobytes()
+                table_img_path = put_blob(table_img_bytes)
+                description = process_graph(table_img_bytes)
 
                 caption = before_text.replace("\n", " ") + description + after_text.replace("\n", " ")
                 if before_text == "" and after_text == "":
                     caption = " ".join(tab.header.names)
                 table_metadata = {
                     "source": f"{filename[:-4]}-page{pagenum}-table{len(table_docs)+1}",
-                    "dataframe": df_xlsx_path,
+                    "dataframe": table_path,
+                    "table_id": table_id,
                     "image": table_img_path,
                     "caption": caption,
                     "type": "table",
@@ -106,11 +219,19 @@ def parse_all_tables(filename, page, pagenum, text_blocks, ongoing_tables):
         print(f"Error during table extraction: {e}")
     return table_docs, table_bboxes, ongoing_tables
 
-def parse_all_images(filename, page, pagenum, text_blocks):
-    """Extract images from a PDF page."""
+def parse_all_images(filename, page, pagenum, block_index, seen_images):
+    """Extract images from a PDF page.
+
+    seen_images is shared by all pages of a document: each unique xref or byte payload is
+    extracted, written and described once, and later occurrences only add their page to the
+    first document's "page_refs".
+    """
     image_docs = []
+    candidates = []
     image_info_list = page.get_image_info(xrefs=True)
     page_rect = page.rect
+    by_xref = seen_images.setdefault("xrefs", {})
+    by_hash = seen_images.setdefault("hashes", {})
 
     for image_info in image_info_list:
         xref = image_info['xref']
@@ -121,34 +242,82 @@ def parse_all_images(filename, page, pagenum, text_blocks):
         if img_bbox.width < page_rect.width / 20 or img_bbox.height < page_rect.height / 20:
             continue
 
-        extracted_image = page.parent.extract_image(xref)
-        image_data = extracted_image["image"]
-        imgrefpath = os.path.join(os.getcwd(), "vectorstore/image_references")
-        os.makedirs(imgrefpath, exist_ok=True)
-        image_path = os.path.join(imgrefpath, f"image{xref}-page{pagenum}.png")
-        with open(image_path, "wb") as img_file:
-            img_file.write(image_data)
+        image = by_xref.get(xref)
+        if image is None:
+            image_data = page.parent.extract_image(xref)["image"]
+            content_hash = hashlib.sha256(image_data).hexdigest()
+            image = by_hash.get(content_hash)
+            if image is None:
+                imgrefpath = os.path.join(os.getcwd(), "vectorstore/image_references")
+                image_path = os.path.join(imgrefpath, f"image-{content_hash[:16]}.png")
+                if not os.path.exists(image_path):
+                    # Page workers may write the same image at once; readers must never see a partial file
+                    atomic_write_bytes(image_path, image_data)
+                image = {"data": image_data, "hash": content_hash, "path": image_path, "description": None, "doc": None}
+                by_hash[content_hash] = image
+            by_xref[xref] = image
+
+        if image["doc"] is not None:
+            if pagenum not in image["doc"].metadata["page_refs"]:
+                image["doc"].metadata["page_refs"].append(pagenum)
+                seen_images.setdefault("repeats", []).append((image["hash"], pagenum))
+            continue
+        if any(image is candidate[0] for candidate in candidates):
+            continue  # repeated on this page; the first occurrence provides the caption
 
-        before_text, after_text = extract_text_around_item(text_blocks, img_bbox, page.rect.height)
+        # An occurrence without surrounding text is skipped, leaving the image for a later page
+        before_text, after_text = extract_text_around_item(block_index, img_bbox, page.rect.height)
         if before_text == "" and after_text == "":
             continue
+        candidates.append((image, xref, before_text, after_text))
 
-        image_description = " "
-        if is_graph(image_data):
-            image_description = process_graph(image_data)
+    # All of the page's new images are described concurrently through the shared VLM client
+    undescribed = [image for image, _, _, _ in candidates if image["description"] is None]
+    for image, description in zip(undescribed, describe_graphs([image["data"] for image in undescribed])):
+        image["description"] = description
 
-        caption = before_text.replace("\n", " ") + image_description + after_text.replace("\n", " ")
+    for image, xref, before_text, after_text in candidates:
+        caption = before_text.replace("\n", " ") + image["description"] + after_text.replace("\n", " ")
 
         image_metadata = {
             "source": f"{filename[:-4]}-page{pagenum}-image{xref}",
-            "image": image_path,
+            "image": image["path"],
+            "image_hash": image["hash"],
             "caption": caption,
             "type": "image",
-            "page_num": pagenum
+            "page_num": pagenum,
+            "page_refs": [pagenum]
         }
-        image_docs.append(Document(text="This is an image with the caption: " + caption, metadata=image_metadata))
+        image["doc"] = Document(text="This is an image with the caption: " + caption, metadata=image_metadata)
+        image["data"] = None  # described, so the bytes are no longer needed
+        image_docs.append(image["doc"])
     return image_docs
 
+def merge_duplicate_images(documents, repeats=(), first_by_hash=None):
+    """Drop image documents whose bytes already appeared earlier, adding their pages to the first one.
+
+    repeats holds (image_hash, page_num) references recorded by workers after the
+    document for that image had been returned. Passing the same first_by_hash dict across
+    calls merges page by page; documents already yielded get their page_refs updated in place.
+    """
+    merged = []
+    first_by_hash = {} if first_by_hash is None else first_by_hash
+    for doc in documents:
+        content_hash = doc.metadata.get("image_hash")
+        if content_hash is None:
+            merged.append(doc)
+            continue
+        first = first_by_hash.setdefault(content_hash, doc)
+        if first is doc:
+            merged.append(doc)
+        else:
+            first.metadata["page_refs"] = sorted(set(first.metadata["page_refs"]) | set(doc.metadata["page_refs"]))
+    for content_hash, pagenum in repeats:
+        first = first_by_hash.get(content_hash)
+        if first is not None and pagenum not in first.metadata["page_refs"]:
+            first.metadata["page_refs"] = sorted(first.metadata["page_refs"] + [pagenum])
+    return merged
+
 def process_ppt_file(ppt_path):
     """Process a PowerPoint file."""
     pdf_path = convert_ppt_to_pdf(ppt_path)
@@ -156,17 +325,17 @@ def process_ppt_file(ppt_path):
     slide_texts = extract_text_and_notes_from_ppt(ppt_path)
     processed_data = []
 
-    for (image_path, page_num), (slide_text, notes) in zip(images_data, slide_texts):
+    slide_images = []
+    for image_path, _ in images_data[:len(slide_texts)]:
+        with open(image_path, 'rb') as image_file:
+            slide_images.append(image_file.read())
+    # Slides are described concurrently through the shared VLM client
+    slide_descriptions = describe_graphs(slide_images)
+
+    for (image_path, page_num), (slide_text, notes), image_description in zip(images_data, slide_texts, slide_descriptions):
         if notes:
             notes = "\n\nThe speaker notes for this slide are: " + notes
         
-        with open(image_path, 'rb') as image_file:
-            image_content = image_file.read()
-        
-        image_description = " "
-        if is_graph(image_content):
-            image_description = process_graph(image_content)
-        
         image_metadata = {
             "source": f"{os.path.basename(ppt_path)}",
             "image": image_path,
@@ -178,35 +347,6 @@ def process_ppt_file(ppt_path):
 
     return processed_data
 
-def convert_ppt_to_pdf(ppt_path):
-    """Convert a PowerPoint file to PDF using LibreOffice."""
-    base_name = os.path.basename(ppt_path)
-    ppt_name_without_ext = os.path.splitext(base_name)[0].replace(' ', '_')
-    new_dir_path = os.path.abspath("vectorstore/ppt_references")
-    os.makedirs(new_dir_path, exist_ok=True)
-    pdf_path = os.path.join(new_dir_path, f"{ppt_name_without_ext}.pdf")
-    command = ['libreoffice', '--headless', '--convert-to', 'pdf', '--outdir', new_dir_path, ppt_path]
-    subprocess.run(command, check=True)
-    return pdf_path
-
-def convert_pdf_to_images(pdf_path):
-    """Convert a PDF file to a series of images using PyMuPDF."""
-    doc = fitz.open(pdf_path)
-    base_name = os.path.basename(pdf_path)
-    pdf_name_without_ext = os.path.splitext(base_name)[0].replace(' ', '_')
-    new_dir_path = os.path.join(os.getcwd(), "vectorstore/ppt_references")
-    os.makedirs(new_dir_path, exist_ok=True)
-    image_paths = []
-
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        pix = page.get_pixmap()
-        output_image_path = os.path.join(new_dir_path, f"{pdf_name_without_ext}_{page_num:04d}.png")
-        pix.save(output_image_path)
-        image_paths.append((output_image_path, page_num))
-    doc.close()
-    return image_paths
-
 def extract_text_and_notes_from_ppt(ppt_path):
     """Extract text and notes from a PowerPoint file."""
     prs = Presentation(ppt_path)
@@ -222,63 +362,161 @@ def extract_text_and_notes_from_ppt(ppt_path):
 
 def load_multimodal_data(files):
     """Load and process multiple file types."""
-    documents = []
+    return list(iter_multimodal_data(files))
+
+def save_uploaded_decks(files):
+    """Save uploaded decks and queue them for conversion up front; returns {id(file): saved path}.
+
+    Only the first upload of each name is saved here, since a later one would overwrite it
+    before it is converted; the rest are saved and converted when their turn comes.
+    """
+    saved, names = {}, set()
+    for file in files:
+        if os.path.splitext(file.name.lower())[1] in ('.ppt', '.pptx') and file.name not in names:
+            try:
+                saved[id(file)] = save_uploaded_file(file)
+                names.add(file.name)
+            except Exception as e:
+                print(f"Error saving PPT {file.name}: {e}")
+    if saved:
+        try:
+            queue_ppt_conversions(list(saved.values()))
+        except Exception as e:
+            print(f"Error queueing PPT conversions: {e}")
+    return saved
+
+def iter_multimodal_data(files):
+    """Yield the documents of multiple files as they are produced; PDFs are streamed page by page.
+
+    Decks are queued for conversion before the first file is processed, so LibreOffice
+    converts them in shared batches while the other files are handled.
+    """
+    files = list(files)
+    saved_decks = save_uploaded_decks(files)
     for file in files:
         file_extension = os.path.splitext(file.name.lower())[1]
         if file_extension in ('.png', '.jpg', '.jpeg'):
             image_content = file.read()
             image_text = describe_image(image_content)
-            doc = Document(text=image_text, metadata={"source": file.name, "type": "image"})
-            documents.append(doc)
+            yield Document(text=image_text, metadata={"source": file.name, "type": "image"})
         elif file_extension == '.pdf':
             try:
-                pdf_documents = get_pdf_documents(file)
-                documents.extend(pdf_documents)
+                yield from iter_pdf_documents(file)
             except Exception as e:
                 print(f"Error processing PDF {file.name}: {e}")
         elif file_extension in ('.ppt', '.pptx'):
             try:
-                ppt_documents = process_ppt_file(save_uploaded_file(file))
-                documents.extend(ppt_documents)
+                ppt_path = saved_decks.pop(id(file), None) or save_uploaded_file(file)
+                ppt_documents = process_ppt_file(ppt_path)
             except Exception as e:
                 print(f"Error processing PPT {file.name}: {e}")
+                continue
+            yield from ppt_documents
         else:
             text = file.read().decode("utf-8")
-            doc = Document(text=text, metadata={"source": file.name, "type": "text"})
-            documents.append(doc)
-    return documents
+            yield Document(text=text, metadata={"source": file.name, "type": "text"})
 
-def load_data_from_directory(directory):
-    """Load and process multiple file types from a directory."""
-    documents = []
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        file_extension = os.path.splitext(filename.lower())[1]
-        print(filename)
-        if file_extension in ('.png', '.jpg', '.jpeg'):
-            with open(filepath, "rb") as image_file:
-                image_content = image_file.read()
-            image_text = describe_image(image_content)
-            doc = Document(text=image_text, metadata={"source": filename, "type": "image"})
-            print(doc)
-            documents.append(doc)
-        elif file_extension == '.pdf':
-            with open(filepath, "rb") as pdf_file:
-                try:
-                    pdf_documents = get_pdf_documents(pdf_file)
-                    documents.extend(pdf_documents)
-                except Exception as e:
-                    print(f"Error processing PDF {filename}: {e}")
-        elif file_extension in ('.ppt', '.pptx'):
+def load_file_from_directory(directory, filename):
+    """Load and process a single file of a directory; returns None if it could not be processed."""
+    filepath = os.path.join(directory, filename)
+    file_extension = os.path.splitext(filename.lower())[1]
+    print(filename)
+    if file_extension in ('.png', '.jpg', '.jpeg'):
+        with open(filepath, "rb") as image_file:
+            image_content = image_file.read()
+        image_text = describe_image(image_content)
+        doc = Document(text=image_text, metadata={"source": filename, "type": "image"})
+        print(doc)
+        return [doc]
+    elif file_extension == '.pdf':
+        with open(filepath, "rb") as pdf_file:
             try:
-                ppt_documents = process_ppt_file(filepath)
-                documents.extend(ppt_documents)
-                print(ppt_documents)
+                return get_pdf_documents(pdf_file)
             except Exception as e:
-                print(f"Error processing PPT {filename}: {e}")
-        else:
-            with open(filepath, "r", encoding="utf-8") as text_file:
-                text = text_file.read()
-            doc = Document(text=text, metadata={"source": filename, "type": "text"})
-            documents.append(doc)
-    return documents
\ No newline at end of file
+                print(f"Error processing PDF {filename}: {e}")
+                return None
+    elif file_extension in ('.ppt', '.pptx'):
+        try:
+            ppt_documents = process_ppt_file(filepath)
+            print(ppt_documents)
+            return ppt_documents
+        except Exception as e:
+            print(f"Error processing PPT {filename}: {e}")
+            return None
+    else:
+        with open(filepath, "r", encoding="utf-8") as text_file:
+            text = text_file.read()
+        return [Document(text=text, metadata={"source": filename, "type": "text"})]
+
+def prefetch_ppt_conversions(directory, filenames):
+    """Queue every deck up front so LibreOffice converts them in shared batches."""
+    ppt_paths = [os.path.join(directory, filename) for filename in filenames
+                 if os.path.splitext(filename.lower())[1] in ('.ppt', '.pptx')]
+    if ppt_paths:
+        try:
+            convert_ppts_to_pdf(ppt_paths)
+        except Exception as e:
+            print(f"Error converting PPT files in {directory}: {e}")
+
+def load_data_from_directory(directory, incremental=False):
+    """Load and process multiple file types from a directory.
+
+    With incremental=True only new or changed files are processed; see sync_directory.
+    """
+    if incremental:
+        return sync_directory(directory)[0]
+    documents = []
+    filenames = os.listdir(directory)
+    prefetch_ppt_conversions(directory, filenames)
+    for filename in filenames:
+        documents.extend(load_file_from_directory(directory, filename) or [])
+    return documents
+
+def sync_directory(directory):
+    """Bring a directory's manifest up to date and return (documents, changed_doc_ids, removed_doc_ids).
+
+    Files whose size and mtime, or failing that content hash, match the manifest are served
+    from the Document cache. Documents of changed and deleted files are reported as removed
+    so callers can delete them from their index.
+    """
+    manifest = directory_manifest.load_manifest(directory)
+    filenames = sorted(name for name in os.listdir(directory) if os.path.isfile(os.path.join(directory, name)))
+    cached, stale = {}, []
+    for filename in filenames:
+        entry = manifest.get(filename)
+        stat = os.stat(os.path.join(directory, filename))
+        content_hash = entry["content_hash"] if directory_manifest.is_unchanged(entry, stat) else \
+            file_hash(os.path.join(directory, filename))
+        if entry is not None and entry["content_hash"] == content_hash:
+            docs = directory_manifest.load_documents(directory, filename, content_hash)
+            if docs is not None:
+                entry.update(size=stat.st_size, mtime=stat.st_mtime)
+                cached[filename] = docs
+                continue
+        stale.append((filename, stat, content_hash))
+
+    removed_doc_ids = []
+    for filename in set(manifest) - set(cached):
+        entry = manifest.pop(filename)
+        removed_doc_ids.extend(entry["doc_ids"])
+        directory_manifest.drop_documents(directory, filename, entry["content_hash"])
+
+    prefetch_ppt_conversions(directory, [filename for filename, _, _ in stale])
+    changed_doc_ids = []
+    for filename, stat, content_hash in stale:
+        docs = load_file_from_directory(directory, filename)
+        if docs is None:
+            continue  # left out of the manifest so the next sync retries it
+        directory_manifest.save_documents(directory, filename, content_hash, docs)
+        manifest[filename] = {
+            "size": stat.st_size, "mtime": stat.st_mtime, "content_hash": content_hash,
+            "doc_ids": [doc.doc_id for doc in docs],
+        }
+        changed_doc_ids.extend(doc.doc_id for doc in docs)
+        cached[filename] = docs
+        # Saved after every file so an interrupted sync keeps the work already done
+        directory_manifest.save_manifest(directory, manifest)
+    directory_manifest.save_manifest(directory, manifest)
+
+    documents = [doc for filename in filenames if filename in cached for doc in cached[filename]]
+    return documents, changed_doc_ids, removed_doc_ids
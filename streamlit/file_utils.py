@@ -0,0 +1,41 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def file_hash(path):
+    """SHA-256 of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def atomic_write(path, write):
+    """Calls write(tmp_path) and moves the result over path, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Unique per process and thread, so concurrent writers of the same path never share a temp file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_bytes(path, data):
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+    atomic_write(path, write)
+
+
+def atomic_write_json(path, payload, **dump_kwargs):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, **dump_kwargs)
+    atomic_write(path, write)
@@ -0,0 +1,148 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from file_utils import atomic_write_json
+
+# Location of the persistent registry of fully indexed documents
+INGEST_REGISTRY_PATH = os.getenv(
+    "RAG_INGEST_REGISTRY", os.path.join(os.getcwd(), "vectorstore", "ingest_registry.json")
+)
+
+_registry_lock = threading.Lock()
+_registry = None
+_registry_mtime = None
+
+# Query parameters that only sign a URL (S3 and GCS presigning) and do not select the object
+_PRESIGN_PARAMS = ("x-amz-", "x-goog-")
+_LEGACY_PRESIGN_PARAMS = {"awsaccesskeyid", "signature", "expires", "googleaccessid"}
+
+
+def _read_registry():
+    try:
+        with open(INGEST_REGISTRY_PATH, "r", encoding="utf-8") as f:
+            registry = json.load(f)
+    except FileNotFoundError:
+        registry = {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable ingest registry {INGEST_REGISTRY_PATH}: {e}")
+        registry = {}
+    registry.setdefault("documents", {})
+    registry.setdefault("sources", {})
+    return registry
+
+
+def _registry_file_mtime():
+    try:
+        return os.path.getmtime(INGEST_REGISTRY_PATH)
+    except OSError:
+        return None
+
+
+def _load_registry():
+    """Returns the registry, re-reading it when another process has saved a newer version."""
+    global _registry, _registry_mtime
+    mtime = _registry_file_mtime()
+    if _registry is None or mtime != _registry_mtime:
+        _registry = _read_registry()
+        _registry_mtime = mtime
+    return _registry
+
+
+def _save_registry(registry):
+    """Atomically writes the registry so concurrent readers never see a partial file."""
+    global _registry_mtime
+    atomic_write_json(INGEST_REGISTRY_PATH, registry, indent=2, sort_keys=True)
+    _registry_mtime = _registry_file_mtime()
+
+
+@contextmanager
+def _locked_registry():
+    """Yields the on-disk registry for modification under a file lock shared by all processes, then saves it.
+
+    The registry is re-read after taking the lock, so entries written by other processes
+    since this one last loaded it are kept.
+    """
+    global _registry
+    os.makedirs(os.path.dirname(INGEST_REGISTRY_PATH) or ".", exist_ok=True)
+    with _registry_lock, open(f"{INGEST_REGISTRY_PATH}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            _registry = _read_registry()
+            yield _registry
+            _save_registry(_registry)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def normalize_source_url(url):
+    """Strips presigning parameters and the fragment so presigned URLs for the same object match.
+
+    Other query parameters are kept, since they may select the document (e.g. ?id=...).
+    """
+    parts = urlsplit(url)
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(_PRESIGN_PARAMS) and key.lower() not in _LEGACY_PRESIGN_PARAMS
+    ]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def lookup_document(content_hash, backend="pinecone"):
+    """Returns the registry entry for a document fully indexed on backend, or None."""
+    with _registry_lock:
+        entry = _load_registry()["documents"].get(content_hash, {}).get(backend)
+        return dict(entry) if entry else None
+
+
+def lookup_source(url, backend="pinecone", fingerprint=None):
+    """Returns the registry entry for a previously ingested source URL, or None.
+
+    fingerprint is the source's current {"etag", "last_modified", "size"}; the entry is only
+    returned if it matches what was recorded at ingest, so a replaced object is re-ingested.
+    Sources that send neither an ETag nor a Last-Modified are never served from here.
+    """
+    if not fingerprint or not (fingerprint.get("etag") or fingerprint.get("last_modified")):
+        return None
+    with _registry_lock:
+        registry = _load_registry()
+        source = registry["sources"].get(normalize_source_url(url))
+        # Sources recorded before fingerprints existed are plain hashes and always revalidated
+        if not isinstance(source, dict) or source.get("fingerprint") != fingerprint:
+            return None
+        content_hash = source["content_hash"]
+        entry = registry["documents"].get(content_hash, {}).get(backend)
+        return dict(entry, content_hash=content_hash) if entry else None
+
+
+def mark_indexed(content_hash, index_name, chunk_count, source_url=None, backend="pinecone", source_fingerprint=None):
+    """Records that every chunk of a document has been upserted into index_name on backend."""
+    with _locked_registry() as registry:
+        registry["documents"].setdefault(content_hash, {})[backend] = {
+            "index_name": index_name,
+            "chunk_count": chunk_count,
+            "indexed_at": time.time(),
+        }
+        if source_url:
+            registry["sources"][normalize_source_url(source_url)] = {
+                "content_hash": content_hash, "fingerprint": source_fingerprint,
+            }
+    logging.info(f"Registered document {content_hash[:8]} ({chunk_count} chunks) in {backend} index {index_name}")
+
+
+def _source_hash(source):
+    return source["content_hash"] if isinstance(source, dict) else source
+
+
+def forget_document(content_hash):
+    """Removes a document so the next request re-ingests it."""
+    with _locked_registry() as registry:
+        removed = registry["documents"].pop(content_hash, None) is not None
+        registry["sources"] = {
+            url: source for url, source in registry["sources"].items() if _source_hash(source) != content_hash
+        }
+    return removed
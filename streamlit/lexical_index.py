@@ -0,0 +1,152 @@
+import os
+import re
+import logging
+import numpy as np
+from file_utils import atomic_write
+from query_cache import TTLLRUCache
+
+# Location of per-document BM25 indexes and BM25 parameters
+LEXICAL_INDEX_DIR = os.getenv("RAG_LEXICAL_INDEX_DIR", os.path.join(os.getcwd(), "vectorstore", "lexical"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[&'.][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what which "
+    "who will with how does do did".split()
+)
+
+# Recently queried indexes stay loaded; entries never expire but are evicted by LRU
+_loaded_indexes = TTLLRUCache(maxsize=64, ttl=float("inf"))
+
+
+def tokenize(text):
+    """Lowercased terms; keeps tickers and acronyms such as 'S&P' or 'U.S.' as single terms."""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks with CSR-style array-backed postings.
+
+    Postings for term t are postings_docs[offsets[t]:offsets[t + 1]] with matching
+    term frequencies in postings_tf, so the whole index is a handful of NumPy arrays.
+    """
+
+    def __init__(self, chunk_ids, texts, terms, offsets, postings_docs, postings_tf, doc_lengths):
+        self.chunk_ids = list(chunk_ids)
+        self.texts = list(texts)
+        self.term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        doc_freq = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((len(doc_lengths) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+    @classmethod
+    def build(cls, chunk_ids, texts):
+        term_ids = {}
+        term_postings = []
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc, text in enumerate(texts):
+            counts = {}
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + 1
+            doc_lengths[doc] = sum(counts.values())
+            for token, count in counts.items():
+                term_id = term_ids.setdefault(token, len(term_ids))
+                if term_id == len(term_postings):
+                    term_postings.append([])
+                term_postings[term_id].append((doc, count))
+
+        offsets = np.zeros(len(term_postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings) for postings in term_postings])
+        postings_docs = np.empty(offsets[-1], dtype=np.int32)
+        postings_tf = np.empty(offsets[-1], dtype=np.uint16)
+        for term_id, postings in enumerate(term_postings):
+            start = offsets[term_id]
+            for position, (doc, count) in enumerate(postings):
+                postings_docs[start + position] = doc
+                postings_tf[start + position] = min(count, np.iinfo(np.uint16).max)
+        return cls(chunk_ids, texts, list(term_ids), offsets, postings_docs, postings_tf, doc_lengths)
+
+    def search(self, query, top_k=10):
+        """Returns up to top_k (chunk_id, score, text) tuples with a positive BM25 score."""
+        if not self.chunk_ids:
+            return []
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings_docs[start:stop]
+            tf = self.postings_tf[start:stop].astype(np.float32)
+            scores[docs] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + length_norm[docs])
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        best = candidates[np.argsort(-scores[candidates])[:top_k]]
+        return [(self.chunk_ids[doc], float(scores[doc]), self.texts[doc]) for doc in best]
+
+    def save(self, path):
+        terms = sorted(self.term_ids, key=self.term_ids.get)
+
+        def write(tmp_path):
+            # Saving through a file object keeps np.savez from appending .npz to the temp name
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    chunk_ids=np.array(self.chunk_ids, dtype=str),
+                    texts=np.array(self.texts, dtype=str),
+                    terms=np.array(terms, dtype=str),
+                    offsets=self.offsets,
+                    postings_docs=self.postings_docs,
+                    postings_tf=self.postings_tf,
+                    doc_lengths=self.doc_lengths,
+                )
+
+        atomic_write(path, write)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["chunk_ids"].tolist(), data["texts"].tolist(), data["terms"].tolist(),
+                data["offsets"], data["postings_docs"], data["postings_tf"], data["doc_lengths"]
+            )
+
+
+def _index_path(document_id):
+    return os.path.join(LEXICAL_INDEX_DIR, f"{document_id}.npz")
+
+
+def build_document_index(document_id, chunk_ids, texts):
+    """Builds, persists and caches the BM25 index for one document's chunks."""
+    index = BM25Index.build(chunk_ids, texts)
+    index.save(_index_path(document_id))
+    _loaded_indexes.put(document_id, index)
+    logging.info(f"Built BM25 index for {document_id[:8]} with {len(index.term_ids)} terms")
+    return index
+
+
+def get_document_index(document_id):
+    """Returns the BM25 index of a document, or None if it was ingested without one."""
+    index = _loaded_indexes.get(document_id)
+    if index is None and os.path.exists(_index_path(document_id)):
+        index = BM25Index.load(_index_path(document_id))
+        _loaded_indexes.put(document_id, index)
+    return index
+
+
+def search_documents(query, document_ids, top_k=10):
+    """BM25 search over the given documents; returns (chunk_id, score, text) tuples."""
+    results = []
+    for document_id in document_ids:
+        index = get_document_index(document_id)
+        if index is not None:
+            results.extend(index.search(query, top_k))
+    results.sort(key=lambda result: -result[1])
+    return results[:top_k]
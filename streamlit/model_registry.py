@@ -0,0 +1,69 @@
+import threading
+import time
+import logging
+from sentence_transformers import CrossEncoder, SentenceTransformer
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_RERANKER_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Models are shared by every Streamlit session and request handled by this process
+_models = {}
+_model_stats = {}
+_registry_lock = threading.Lock()
+_key_locks = {}
+
+
+def _model_memory_bytes(model):
+    """Approximates the footprint of a model from its parameters and buffers."""
+    try:
+        module = getattr(model, "model", model)  # CrossEncoder wraps the torch module
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return None
+
+
+def get_model(model_name=DEFAULT_MODEL_NAME, device=None, loader=SentenceTransformer):
+    """Returns the process-wide model for (model_name, device), loading it on first use."""
+    key = (model_name, device)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    # One lock per key so loading one model does not block lookups of another
+    with _registry_lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        model = _models.get(key)
+        if model is None:
+            start = time.perf_counter()
+            model = loader(model_name, device=device)
+            load_seconds = time.perf_counter() - start
+            _model_stats[key] = {
+                "model_name": model_name,
+                "device": device or str(getattr(model, "device", "default")),
+                "load_seconds": load_seconds,
+                "memory_bytes": _model_memory_bytes(model),
+                "loaded_at": time.time(),
+            }
+            _models[key] = model
+            logging.info(f"Loaded model {model_name} on {_model_stats[key]['device']} in {load_seconds:.2f}s")
+    return model
+
+
+def get_cross_encoder(model_name=DEFAULT_RERANKER_NAME, device=None):
+    """Returns the process-wide cross-encoder used for re-ranking."""
+    return get_model(model_name, device=device, loader=CrossEncoder)
+
+
+def model_stats():
+    """Returns load time and memory footprint for every model loaded in this process."""
+    return [dict(stats) for stats in _model_stats.values()]
+
+
+def unload_model(model_name=DEFAULT_MODEL_NAME, device=None):
+    """Drops a model from the registry so the next get_model call reloads it."""
+    key = (model_name, device)
+    with _registry_lock:
+        _model_stats.pop(key, None)
+        return _models.pop(key, None) is not None
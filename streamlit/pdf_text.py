@@ -0,0 +1,62 @@
+import os
+import re
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF for PDF extraction
+
+# Parallel extraction configuration
+EXTRACT_WORKERS = int(os.getenv("RAG_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+EXTRACT_MIN_PAGES = int(os.getenv("RAG_EXTRACT_MIN_PAGES", 100))
+RANGES_PER_WORKER = 4
+
+# Set once per worker process by the pool initializer so the PDF is not re-sent with every task
+_worker_source = None
+
+
+def sanitize_text(text):
+    return re.sub(r'[^\x00-\x7F]+', ' ', text).replace('\n', ' ').strip()
+
+
+def _open_source(source):
+    """Opens a PDF given as a file path or as raw bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def extract_page_range(source, start, stop):
+    """Returns sanitized text for pages [start, stop) of the PDF."""
+    with _open_source(source) as pdf:
+        return [sanitize_text(pdf[page_number].get_text()) for page_number in range(start, stop)]
+
+
+def _init_worker(source):
+    global _worker_source
+    _worker_source = source
+
+
+def _extract_worker_range(page_range):
+    return extract_page_range(_worker_source, *page_range)
+
+
+def _split_pages(page_count, parts):
+    step = -(-page_count // parts)
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+
+def extract_page_texts(source, page_count=None, workers=EXTRACT_WORKERS, min_pages=EXTRACT_MIN_PAGES):
+    """Extracts sanitized page texts in page order, using a process pool for long documents.
+
+    Each worker opens the document itself and handles contiguous page ranges; documents with
+    fewer than min_pages pages, or workers <= 1, are extracted serially in this process.
+    """
+    if page_count is None:
+        with _open_source(source) as pdf:
+            page_count = pdf.page_count
+    if workers <= 1 or page_count < min_pages:
+        return extract_page_range(source, 0, page_count)
+
+    page_ranges = _split_pages(page_count, workers * RANGES_PER_WORKER)
+    logging.info(f"Extracting {page_count} pages with {workers} worker processes")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source,)) as executor:
+        return [text for texts in executor.map(_extract_worker_range, page_ranges) for text in texts]
@@ -0,0 +1,252 @@
+import fcntl
+import itertools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+import fitz
+from file_utils import atomic_write, atomic_write_json, file_hash
+
+# Converted decks and rendered slides are cached by the SHA-256 of the source file
+PPT_CACHE_DIR = os.getenv("PPT_CACHE_DIR", os.path.join(os.getcwd(), "vectorstore", "ppt_references"))
+LIBREOFFICE_BIN = os.getenv("PPT_LIBREOFFICE_BIN", "libreoffice")
+# Decks waiting in the queue are converted together by one LibreOffice invocation
+PPT_CONVERT_BATCH = int(os.getenv("PPT_CONVERT_BATCH", 16))
+PPT_CONVERT_TIMEOUT = float(os.getenv("PPT_CONVERT_TIMEOUT", 600))
+# How long a caller waits for its deck, including time queued behind other batches
+PPT_WAIT_TIMEOUT = float(os.getenv("PPT_WAIT_TIMEOUT", 1800))
+PPT_RENDER_DPI = int(os.getenv("PPT_RENDER_DPI", 72))
+PPT_RENDER_WORKERS = int(os.getenv("PPT_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+PPT_PARALLEL_MIN_SLIDES = int(os.getenv("PPT_PARALLEL_MIN_SLIDES", 8))
+
+_DONE = object()
+
+
+def _cache_dir(content_hash):
+    return os.path.join(PPT_CACHE_DIR, content_hash)
+
+
+def _claim_profile_dir():
+    """Returns (profile_dir, lock_file) for a LibreOffice profile no other process is using.
+
+    soffice refuses a profile another instance has locked, so each process holds a flock on
+    its own numbered profile; slots are reused after a process exits instead of piling up.
+    """
+    os.makedirs(PPT_CACHE_DIR, exist_ok=True)
+    for slot in itertools.count():
+        profile_dir = os.path.join(PPT_CACHE_DIR, f"libreoffice-profile-{slot}")
+        lock_file = open(f"{profile_dir}.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        return profile_dir, lock_file
+
+
+class LibreOfficeConverter:
+    """Long-lived worker thread that converts queued decks to PDF in batches.
+
+    Every invocation reuses one LibreOffice user profile owned by this process, so only the
+    first pays for creating it, and all decks queued while a batch runs are converted by the
+    next single invocation instead of one process start per deck.
+    """
+
+    def __init__(self, binary=LIBREOFFICE_BIN, batch_size=PPT_CONVERT_BATCH, timeout=PPT_CONVERT_TIMEOUT):
+        self.binary = binary
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.profile_dir, self._profile_lock = _claim_profile_dir()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="libreoffice-converter", daemon=True)
+        self._thread.start()
+
+    def submit(self, ppt_path, content_hash, pdf_path):
+        """Queues ppt_path for conversion to pdf_path; the returned future resolves to pdf_path."""
+        future = Future()
+        self._queue.put((ppt_path, content_hash, pdf_path, future))
+        return future
+
+    def close(self):
+        self._queue.put(_DONE)
+        self._thread.join()
+        self._profile_lock.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    self._convert(batch)
+                    return
+                batch.append(item)
+            self._convert(batch)
+
+    def _convert(self, batch):
+        """Converts a batch; every future is resolved even if staging, LibreOffice or the cache copy fails."""
+        try:
+            self._convert_batch(batch)
+        except Exception as e:
+            logging.error(f"PPT conversion batch failed: {e}")
+            error = e
+        else:
+            error = "no output produced"
+        for ppt_path, _, _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError(f"LibreOffice could not convert {ppt_path}: {error}"))
+
+    def _convert_batch(self, batch):
+        with tempfile.TemporaryDirectory(prefix="ppt-convert-") as work_dir:
+            # Inputs are staged under their content hash so decks sharing a file name do not overwrite each other
+            staged = {}
+            for ppt_path, content_hash, pdf_path, future in batch:
+                staged_path = os.path.join(work_dir, content_hash + os.path.splitext(ppt_path)[1].lower())
+                try:
+                    if not os.path.exists(staged_path):
+                        shutil.copyfile(ppt_path, staged_path)
+                except OSError as e:
+                    future.set_exception(RuntimeError(f"Could not stage {ppt_path} for conversion: {e}"))
+                    continue
+                staged.setdefault(staged_path, []).append((ppt_path, pdf_path, future))
+            if not staged:
+                return
+            out_dir = os.path.join(work_dir, "out")
+            command = [
+                self.binary, "--headless", "--norestore",
+                f"-env:UserInstallation=file://{os.path.abspath(self.profile_dir)}",
+                "--convert-to", "pdf", "--outdir", out_dir, *staged,
+            ]
+            try:
+                subprocess.run(command, check=True, capture_output=True, timeout=self.timeout)
+                error = None
+            except (OSError, subprocess.SubprocessError) as e:
+                error = e
+            for staged_path, decks in staged.items():
+                converted = os.path.join(out_dir, os.path.splitext(os.path.basename(staged_path))[0] + ".pdf")
+                for ppt_path, pdf_path, future in decks:
+                    try:
+                        if not os.path.exists(converted):
+                            raise RuntimeError(f"LibreOffice could not convert {ppt_path}: {error}")
+                        # Atomic, since queue_ppt_conversions treats an existing deck.pdf as finished
+                        atomic_write(pdf_path, lambda tmp_path: shutil.copyfile(converted, tmp_path))
+                    except Exception as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(pdf_path)
+        logging.info(f"Converted {len(batch)} deck(s) in one LibreOffice invocation")
+
+
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def get_converter():
+    """Returns the process-wide LibreOfficeConverter, starting its worker thread on first use."""
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            _converter = LibreOfficeConverter()
+        return _converter
+
+
+_in_flight = {}  # content hash -> future of a queued conversion
+_in_flight_lock = threading.Lock()
+
+
+def queue_ppt_conversions(ppt_paths):
+    """Queues decks for conversion without waiting and returns one future per deck resolving to its PDF.
+
+    Cached decks resolve immediately, and a deck already queued by an earlier call shares
+    that call's future instead of being converted twice.
+    """
+    futures = []
+    for ppt_path in ppt_paths:
+        content_hash = file_hash(ppt_path)
+        pdf_path = os.path.join(_cache_dir(content_hash), "deck.pdf")
+        with _in_flight_lock:
+            future = _in_flight.get(content_hash)
+            if future is None and os.path.exists(pdf_path):
+                future = Future()
+                future.set_result(pdf_path)
+            elif future is None:
+                future = get_converter().submit(ppt_path, content_hash, pdf_path)
+                _in_flight[content_hash] = future
+                future.add_done_callback(lambda _, key=content_hash: _in_flight.pop(key, None))
+        futures.append(future)
+    return futures
+
+
+def convert_ppts_to_pdf(ppt_paths):
+    """Converts decks to PDF, reusing cached conversions; uncached decks are queued together so they share a batch."""
+    return [future.result(timeout=PPT_WAIT_TIMEOUT) for future in queue_ppt_conversions(ppt_paths)]
+
+
+def convert_ppt_to_pdf(ppt_path):
+    """Convert a PowerPoint file to PDF using LibreOffice."""
+    return convert_ppts_to_pdf([ppt_path])[0]
+
+
+def _slides_root(pdf_path):
+    """Cached decks keep their slides beside deck.pdf; any other PDF is keyed by its own hash."""
+    if os.path.dirname(os.path.dirname(os.path.abspath(pdf_path))) == os.path.abspath(PPT_CACHE_DIR):
+        return os.path.dirname(os.path.abspath(pdf_path))
+    return _cache_dir(file_hash(pdf_path))
+
+
+_worker_pdf = None
+
+
+def _init_render_worker(pdf_path):
+    global _worker_pdf
+    _worker_pdf = fitz.open(pdf_path)
+
+
+def _render_slide(args):
+    page_num, dpi, output_path = args
+    _worker_pdf.load_page(page_num).get_pixmap(dpi=dpi).save(output_path)
+    return output_path
+
+
+def convert_pdf_to_images(pdf_path, dpi=PPT_RENDER_DPI, workers=PPT_RENDER_WORKERS, min_slides=PPT_PARALLEL_MIN_SLIDES):
+    """Convert a PDF file to a series of images using PyMuPDF.
+
+    Slides are rendered next to the cached PDF and reused for the same deck and DPI.
+    """
+    output_dir = os.path.join(_slides_root(pdf_path), f"slides-{dpi}dpi")
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            image_paths = [(path, page_num) for path, page_num in json.load(f)]
+        if all(os.path.exists(path) for path, _ in image_paths):
+            return image_paths
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(output_dir, exist_ok=True)
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    jobs = [(page_num, dpi, os.path.join(output_dir, f"slide_{page_num:04d}.png")) for page_num in range(page_count)]
+    if workers > 1 and page_count >= min_slides:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker, initargs=(pdf_path,)) as executor:
+            paths = list(executor.map(_render_slide, jobs))
+    else:
+        with fitz.open(pdf_path) as doc:
+            for page_num, _, output_path in jobs:
+                doc.load_page(page_num).get_pixmap(dpi=dpi).save(output_path)
+        paths = [output_path for _, _, output_path in jobs]
+
+    image_paths = [(path, page_num) for page_num, path in enumerate(paths)]
+    atomic_write_json(manifest_path, image_paths)
+    return image_paths
@@ -0,0 +1,105 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Cache sizing; TTLs are in seconds
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", 1024))
+QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", 3600))
+EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", 4096))
+EMBEDDING_CACHE_TTL = float(os.getenv("RAG_EMBEDDING_CACHE_TTL", 24 * 3600))
+
+
+class TTLLRUCache:
+    """Thread-safe LRU cache whose entries also expire ttl seconds after insertion."""
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate=None):
+        """Drops every entry whose key satisfies predicate (all entries if None); returns the count."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Retrieved matches keyed by (document key, normalized query, top_k)
+result_cache = TTLLRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+# Query vectors keyed by (model identity, normalized query)
+embedding_cache = TTLLRUCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+
+
+def normalize_query(query):
+    """Collapses whitespace and case; the MiniLM embedding model is uncased."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def document_key(document_ids):
+    """Canonical form of the document scope of a query; None means the whole library."""
+    if not document_ids:
+        return None
+    if isinstance(document_ids, str):
+        return (document_ids,)
+    return tuple(sorted(document_ids))
+
+
+def result_key(document_ids, query, top_k):
+    return (document_key(document_ids), normalize_query(query), top_k)
+
+
+def invalidate_document(document_id):
+    """Drops cached results that could include document_id, e.g. after it is re-ingested."""
+    return result_cache.invalidate(lambda key: key[0] is None or document_id in key[0])
+
+
+def cache_stats():
+    """Hit-rate counters for sizing the caches."""
+    return {"results": result_cache.stats(), "embeddings": embedding_cache.stats()}
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import threading
+import logging
+import concurrent.futures
+import ingest_registry
+import tracing
+from pdf_text import sanitize_text
+from vector_store import LocalVectorIndex
+from RAG import (
+    EMBED_BATCH_SIZE, SHARED_INDEX_NAME, VECTOR_BACKEND, _is_shared_index_entry, connect_or_create_index,
+    create_chunk_embeddings, download_pdf_file, finalize_ingest, find_best_match, load_model, source_fingerprint,
+    split_text_into_chunks, upload_chunks_with_metadata,
+)
+
+# Bounded queues between stages provide backpressure: extraction pauses when embedding falls behind
+PAGE_QUEUE_SIZE = int(os.getenv("RAG_ASYNC_PAGE_QUEUE", 16))
+BATCH_QUEUE_SIZE = int(os.getenv("RAG_ASYNC_BATCH_QUEUE", 4))
+
+_DONE = object()
+
+
+def _put_from_thread(loop, queue, item, stop):
+    """Blocks the calling thread until queue accepts item, giving up once stop is set."""
+    future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+    while True:
+        try:
+            return future.result(timeout=0.5)
+        except concurrent.futures.TimeoutError:
+            if stop.is_set():
+                future.cancel()
+                return None
+
+
+def _extract_pages(loop, page_queue, pdf, stop):
+    """Runs in a worker thread: pushes sanitized page text onto page_queue in page order."""
+    try:
+        with pdf.open() as doc:
+            for page_number in range(doc.page_count):
+                if stop.is_set():
+                    return
+                page_text = sanitize_text(doc[page_number].get_text())
+                if page_text:
+                    _put_from_thread(loop, page_queue, page_text, stop)
+    finally:
+        if not stop.is_set():
+            _put_from_thread(loop, page_queue, _DONE, stop)
+
+
+async def _chunk_and_embed(page_queue, batch_queue, model, all_chunks):
+    """Splits pages into chunks as they arrive and emits embedded batches of EMBED_BATCH_SIZE."""
+    carry, pending = "", []
+
+    async def emit(chunks):
+        start_index = len(all_chunks)
+        all_chunks.extend(chunks)
+        with tracing.span("embed_batch", chunks=len(chunks)):
+            embeddings = await asyncio.to_thread(create_chunk_embeddings, chunks, model)
+        # create_chunk_embeddings logs failures and returns an empty matrix; a partial document must not be finalized
+        if len(embeddings) != len(chunks):
+            raise RuntimeError(f"Embedding failed for chunks {start_index}-{start_index + len(chunks) - 1}")
+        await batch_queue.put((start_index, chunks, embeddings))
+
+    while True:
+        page_text = await page_queue.get()
+        if page_text is _DONE:
+            break
+        chunks = split_text_into_chunks(f"{carry} {page_text}" if carry else page_text)
+        # The last chunk may continue on the next page, so it is re-split together with it
+        carry = chunks.pop() if chunks else ""
+        pending.extend(chunks)
+        while len(pending) >= EMBED_BATCH_SIZE:
+            await emit(pending[:EMBED_BATCH_SIZE])
+            pending = pending[EMBED_BATCH_SIZE:]
+    if carry:
+        pending.append(carry)
+    if pending:
+        await emit(pending)
+    await batch_queue.put(_DONE)
+
+
+async def _upsert_batches(batch_queue, index_future, document_id):
+    """Upserts embedded batches as soon as both they and the index are ready."""
+    uploaded = 0
+    while True:
+        item = await batch_queue.get()
+        if item is _DONE:
+            break
+        start_index, chunks, embeddings = item
+        index = await index_future
+        with tracing.span("upsert_batch") as span:
+            count = await asyncio.to_thread(
+                upload_chunks_with_metadata, chunks, embeddings, index, document_id, start_index, False
+            )
+            span.set(vectors=count)
+        uploaded += count
+    index = await index_future
+    if isinstance(index, LocalVectorIndex):
+        await asyncio.to_thread(index.flush)
+    return uploaded
+
+
+async def _ingest_streaming(pdf, pdf_url, model, index_future):
+    document_id = pdf.content_hash
+    loop = asyncio.get_running_loop()
+    page_queue = asyncio.Queue(maxsize=PAGE_QUEUE_SIZE)
+    batch_queue = asyncio.Queue(maxsize=BATCH_QUEUE_SIZE)
+    stop = threading.Event()
+    all_chunks = []
+
+    tasks = [
+        asyncio.ensure_future(asyncio.to_thread(_extract_pages, loop, page_queue, pdf, stop)),
+        asyncio.ensure_future(_chunk_and_embed(page_queue, batch_queue, model, all_chunks)),
+        asyncio.ensure_future(_upsert_batches(batch_queue, index_future, document_id)),
+    ]
+    try:
+        _, _, uploaded = await asyncio.gather(*tasks)
+    except BaseException:
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        raise
+    # Only a document whose every non-empty chunk reached the index is recorded as fully indexed
+    if uploaded and uploaded == sum(1 for chunk in all_chunks if chunk):
+        await asyncio.to_thread(finalize_ingest, document_id, all_chunks, uploaded, pdf_url, pdf.fingerprint)
+    return uploaded
+
+
+async def run_rag_pipeline_async(pdf_url, user_query, model_type='sentence-transformers', trace=None):
+    """Asyncio variant of RAG.run_rag_pipeline that overlaps its stages.
+
+    The model load and index provisioning run while the PDF downloads; pages are then
+    extracted, chunked, embedded and upserted concurrently through bounded queues.
+    """
+    with tracing.activate(trace if trace is not None else tracing.Trace()):
+        model_future = asyncio.ensure_future(asyncio.to_thread(load_model, model_type))
+        index_future = asyncio.ensure_future(asyncio.to_thread(connect_or_create_index, SHARED_INDEX_NAME))
+
+        with tracing.span("ingest") as ingest_span:
+            fingerprint = await asyncio.to_thread(source_fingerprint, pdf_url)
+            entry = ingest_registry.lookup_source(pdf_url, VECTOR_BACKEND, fingerprint)
+            document_id = entry["content_hash"] if _is_shared_index_entry(entry) else None
+            ingest_span.set(cache_hit=document_id is not None)
+            if document_id is None:
+                with tracing.span("download") as span:
+                    pdf = await asyncio.to_thread(download_pdf_file, pdf_url)
+                    span.set(bytes=pdf.size)
+                try:
+                    document_id = pdf.content_hash
+                    entry = ingest_registry.lookup_document(document_id, VECTOR_BACKEND)
+                    if _is_shared_index_entry(entry):
+                        ingest_span.set(cache_hit=True)
+                        ingest_registry.mark_indexed(
+                            document_id, SHARED_INDEX_NAME, entry["chunk_count"], pdf_url, VECTOR_BACKEND, pdf.fingerprint
+                        )
+                    else:
+                        model = await model_future
+                        uploaded = await _ingest_streaming(pdf, pdf_url, model, index_future)
+                        logging.info(f"Streamed {uploaded} chunks of {document_id[:8]} into {SHARED_INDEX_NAME}")
+                finally:
+                    pdf.close()
+
+        model, index = await asyncio.gather(model_future, index_future)
+        return await asyncio.to_thread(find_best_match, user_query, index, model, document_id)
+
+
+def run_rag_pipeline_concurrent(pdf_url, user_query, model_type='sentence-transformers', trace=None):
+    """Synchronous entry point for callers without an event loop, such as Streamlit."""
+    return asyncio.run(run_rag_pipeline_async(pdf_url, user_query, model_type, trace))
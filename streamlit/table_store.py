@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from file_utils import atomic_write, atomic_write_bytes, atomic_write_json
+
+# Tables are stored one Parquet file per document, one row group per table; images are content-addressed blobs
+TABLE_STORE_DIR = os.getenv("TABLE_STORE_DIR", os.path.join(os.getcwd(), "vectorstore", "table_store"))
+
+_SCHEMA = pa.schema([("row", pa.int32()), ("cells", pa.list_(pa.string()))])
+
+_index_lock = threading.Lock()
+_index_cache = {}  # parquet path -> (mtime, table index)
+
+
+def document_key(pdf_bytes):
+    """Content hash naming a document's table file, so equal filenames in different documents never collide."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def table_file_path(key):
+    return os.path.join(TABLE_STORE_DIR, "tables", f"{key}.parquet")
+
+
+def _index_path(path):
+    return f"{path[:-len('.parquet')]}.index.json"
+
+
+def put_blob(data, extension="png"):
+    """Stores data under its SHA-256 and returns the path; identical images are written once."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(TABLE_STORE_DIR, "blobs", digest[:2], f"{digest}.{extension}")
+    if not os.path.exists(path):
+        atomic_write_bytes(path, data)
+    return path
+
+
+class TableWriter:
+    """Buffers a document's tables and writes them to its Parquet file on close.
+
+    add() only records the table, so page workers can fill their own writer and hand
+    `pending` back to the parent process, which merges it with extend() before close().
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.path = table_file_path(key)
+        self.pending = []
+
+    def add(self, table_id, dataframe, page_num):
+        """Queues dataframe under table_id and returns the path of the file it will be written to."""
+        columns = [str(column) for column in dataframe.columns]
+        rows = [[None if pd.isna(value) else str(value) for value in row] for row in dataframe.itertuples(index=False)]
+        self.pending.append({"table_id": table_id, "page_num": page_num, "columns": columns, "rows": rows})
+        return self.path
+
+    def extend(self, pending):
+        self.pending.extend(pending)
+
+    def close(self):
+        """Writes all buffered tables in page order, replacing any previous file for this document."""
+        if not self.pending:
+            return
+        tables = sorted(self.pending, key=lambda table: table["page_num"])
+        index = {}
+
+        def write_parquet(tmp_path):
+            with pq.ParquetWriter(tmp_path, _SCHEMA) as writer:
+                row_group = 0
+                for table in tables:
+                    entry = {"row_group": None, "columns": table["columns"], "page_num": table["page_num"]}
+                    index[table["table_id"]] = entry
+                    if not table["rows"]:
+                        continue  # an empty write adds no row group
+                    batch = pa.table({"row": list(range(len(table["rows"]))), "cells": table["rows"]}, schema=_SCHEMA)
+                    # A single write_table call per table keeps each table in exactly one row group
+                    writer.write_table(batch, row_group_size=len(table["rows"]))
+                    entry["row_group"] = row_group
+                    row_group += 1
+
+        atomic_write(self.path, write_parquet)
+        atomic_write_json(_index_path(self.path), index)
+        self.pending = []
+
+
+def _load_index(path):
+    """Returns the table_id -> row group index of a table file, re-reading it only when it changes."""
+    index_path = _index_path(path)
+    mtime = os.path.getmtime(index_path)
+    with _index_lock:
+        cached = _index_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    with _index_lock:
+        _index_cache[path] = (mtime, index)
+    return index
+
+
+def list_tables(path):
+    """Returns the ids of the tables stored in a document's table file."""
+    return list(_load_index(path))
+
+
+def load_table(path, table_id):
+    """Reads only the row group holding table_id and returns it as a DataFrame."""
+    entry = _load_index(path).get(table_id)
+    if entry is None:
+        raise KeyError(f"Table {table_id} not found in {path}")
+    if entry["row_group"] is None:
+        return pd.DataFrame(columns=entry["columns"])
+    rows = pq.ParquetFile(path).read_row_group(entry["row_group"], columns=["cells"]).column("cells").to_pylist()
+    return pd.DataFrame(rows, columns=entry["columns"])
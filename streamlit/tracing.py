@@ -0,0 +1,108 @@
+import contextvars
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+# The trace collecting spans for the request running in this thread or task
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+_current_depth = contextvars.ContextVar("rag_span_depth", default=0)
+
+
+class Span:
+    """One timed stage with free-form attributes such as byte counts or cache hits."""
+
+    def __init__(self, name, depth, attrs):
+        self.name = name
+        self.depth = depth
+        self.attrs = dict(attrs)
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Trace:
+    """Spans recorded for one pipeline run, in the order they started."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def as_rows(self):
+        """Flat rows suitable for logging or st.table, children indented under their parent."""
+        return [
+            {
+                "stage": "  " * span.depth + span.name,
+                "ms": round(span.duration * 1000, 1) if span.duration is not None else None,
+                **span.attrs,
+            }
+            for span in self.spans
+        ]
+
+
+class MetricsRegistry:
+    """Process-wide aggregates of span durations and cache hit/miss flags per stage."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            stats = self._stages.setdefault(
+                span.name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "cache_hits": 0, "cache_misses": 0}
+            )
+            stats["count"] += 1
+            stats["total_seconds"] += span.duration
+            stats["max_seconds"] = max(stats["max_seconds"], span.duration)
+            if "cache_hit" in span.attrs:
+                stats["cache_hits" if span.attrs["cache_hit"] else "cache_misses"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: dict(stats, mean_seconds=stats["total_seconds"] / stats["count"])
+                for name, stats in self._stages.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def activate(trace):
+    """Makes trace the destination of spans opened in this context."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times a stage, then logs it and records it in the active trace and in metrics."""
+    depth = _current_depth.get()
+    current = Span(name, depth, attrs)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(current)
+    depth_token = _current_depth.set(depth + 1)
+    try:
+        yield current
+    finally:
+        _current_depth.reset(depth_token)
+        current.duration = time.perf_counter() - current.start
+        metrics.record(current)
+        details = " ".join(f"{key}={value}" for key, value in current.attrs.items())
+        logging.info(f"span {name} {current.duration * 1000:.1f} ms {details}".rstrip())
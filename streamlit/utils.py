@@ -15,24 +15,64 @@
 
 import os
 import base64
-import fitz
+import threading
+import logging
+from bisect import bisect_left, bisect_right
 from io import BytesIO
 from PIL import Image
-import requests
 from llama_index.llms.nvidia import NVIDIA
+from vlm_cache import cached_vlm_call
+from vlm_client import get_vlm_client
+
+# Models and prompts; together with the image bytes they form the VLM cache key
+DESCRIBE_IMAGE_MODEL = "nvidia/neva-22b"
+DESCRIBE_IMAGE_PROMPT = "Describe what you see in this image."
+DEPLOT_MODEL = "google/deplot"
+DEPLOT_PROMPT = "Generate underlying data table of the figure below:"
+GRAPH_EXPLAIN_MODEL = "meta/llama-3.1-405b-instruct"
+GRAPH_EXPLAIN_PROMPT = "Your responsibility is to explain charts. You are an expert in describing the responses of linearized tables into plain English text for LLMs to use. Explain the following linearized table."
+
+# Images sent to the VLM are downscaled to VLM_IMAGE_MAX_EDGE pixels on their longest side and re-encoded as JPEG;
+# JPEGs already within that size and under VLM_IMAGE_PASSTHROUGH_BYTES are sent without being decoded
+VLM_IMAGE_MAX_EDGE = int(os.getenv("VLM_IMAGE_MAX_EDGE", 1568))
+VLM_JPEG_QUALITY = int(os.getenv("VLM_JPEG_QUALITY", 85))
+VLM_IMAGE_PASSTHROUGH_BYTES = int(os.getenv("VLM_IMAGE_PASSTHROUGH_BYTES", 256 * 1024))
+
+_payload_lock = threading.Lock()
+payload_stats = {"images": 0, "passthrough": 0, "resized": 0, "bytes_in": 0, "bytes_out": 0}
 
 def set_environment_variables():
     """Set necessary environment variables."""
     os.environ["NVIDIA_API_KEY"] = "" #set API key
 
+def prepare_vlm_image(image_content, max_edge=VLM_IMAGE_MAX_EDGE, quality=VLM_JPEG_QUALITY,
+                      passthrough_bytes=VLM_IMAGE_PASSTHROUGH_BYTES):
+    """Return JPEG bytes of the image no larger than max_edge on its longest side."""
+    img = Image.open(BytesIO(image_content))  # reads the header only; pixels are decoded on first use
+    resize = max(img.size) > max_edge
+    if img.format == "JPEG" and img.mode == "RGB" and not resize and len(image_content) <= passthrough_bytes:
+        encoded, passthrough = image_content, True
+    else:
+        if resize:
+            img.draft("RGB", (max_edge, max_edge))  # lets large JPEGs decode at reduced scale
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        buffered = BytesIO()
+        img.save(buffered, format="JPEG", quality=quality, optimize=True)
+        encoded, passthrough = buffered.getvalue(), False
+    with _payload_lock:
+        payload_stats["images"] += 1
+        payload_stats["passthrough"] += passthrough
+        payload_stats["resized"] += resize
+        payload_stats["bytes_in"] += len(image_content)
+        payload_stats["bytes_out"] += len(encoded)
+    logging.debug(f"VLM image payload {len(image_content)} -> {len(encoded)} bytes")
+    return encoded
+
 def get_b64_image_from_content(image_content):
     """Convert image content to base64 encoded string."""
-    img = Image.open(BytesIO(image_content))
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    buffered = BytesIO()
-    img.save(buffered, format="JPEG")
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+    return base64.b64encode(prepare_vlm_image(image_content)).decode("utf-8")
 
 def is_graph(image_content):
     """Determine if an image is a graph, plot, chart, or table."""
@@ -47,93 +87,88 @@ class MockNVIDIA:
         return f"Mocked response for: {text}"
 
 # Example usage in `process_graph`
+@cached_vlm_call(GRAPH_EXPLAIN_MODEL, GRAPH_EXPLAIN_PROMPT)
 def process_graph(image_content):
     """Process a graph image and generate a description."""
-    mixtral = MockNVIDIA(model_name="meta/llama-3.1-405b-instruct")
-    response = mixtral.complete(
-        "Your responsibility is to explain charts. You are an expert in describing the responses of linearized tables into plain English text for LLMs to use. Explain the following linearized table."
-    )
+    mixtral = MockNVIDIA(model_name=GRAPH_EXPLAIN_MODEL)
+    response = mixtral.complete(GRAPH_EXPLAIN_PROMPT)
     return response
 
+@cached_vlm_call(DESCRIBE_IMAGE_MODEL, DESCRIBE_IMAGE_PROMPT)
 def describe_image(image_content):
     """Generate a description of an image using NVIDIA API."""
     image_b64 = get_b64_image_from_content(image_content)
-    invoke_url = "https://ai.api.nvidia.com/v1/vlm/nvidia/neva-22b"
-    api_key = os.getenv("NVIDIA_API_KEY")
-    
-    if not api_key:
-        raise ValueError("NVIDIA API Key is not set. Please set the NVIDIA_API_KEY environment variable.")
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "application/json"
-    }
-
-    payload = {
-        "messages": [
-            {
-                "role": "user",
-                "content": f'Describe what you see in this image. <img src="data:image/png;base64,{image_b64}" />'
-            }
-        ],
-        "max_tokens": 1024,
-        "temperature": 0.20,
-        "top_p": 0.70,
-        "seed": 0,
-        "stream": False
-    }
-
-    response = requests.post(invoke_url, headers=headers, json=payload)
-    return response.json()["choices"][0]['message']['content']
+    return get_vlm_client().complete(
+        DESCRIBE_IMAGE_MODEL,
+        f'{DESCRIBE_IMAGE_PROMPT} <img src="data:image/png;base64,{image_b64}" />',
+        max_tokens=1024,
+        temperature=0.20,
+        top_p=0.70,
+        seed=0,
+    )
 
+@cached_vlm_call(DEPLOT_MODEL, DEPLOT_PROMPT)
 def process_graph_deplot(image_content):
     """Process a graph image using NVIDIA's Deplot API."""
-    invoke_url = "https://ai.api.nvidia.com/v1/vlm/google/deplot"
     image_b64 = get_b64_image_from_content(image_content)
-    api_key = os.getenv("NVIDIA_API_KEY")
-    
-    if not api_key:
-        raise ValueError("NVIDIA API Key is not set. Please set the NVIDIA_API_KEY environment variable.")
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "application/json"
-    }
-
-    payload = {
-        "messages": [
-            {
-                "role": "user",
-                "content": f'Generate underlying data table of the figure below: <img src="data:image/png;base64,{image_b64}" />'
-            }
-        ],
-        "max_tokens": 1024,
-        "temperature": 0.20,
-        "top_p": 0.20,
-        "stream": False
-    }
-
-    response = requests.post(invoke_url, headers=headers, json=payload)
-    return response.json()["choices"][0]['message']['content']
+    return get_vlm_client().complete(
+        DEPLOT_MODEL,
+        f'{DEPLOT_PROMPT} <img src="data:image/png;base64,{image_b64}" />',
+        max_tokens=1024,
+        temperature=0.20,
+        top_p=0.20,
+    )
 
-def extract_text_around_item(text_blocks, bbox, page_height, threshold_percentage=0.1):
-    """Extract text above and below a given bounding box on a page."""
-    before_text, after_text = "", ""
-    vertical_threshold_distance = page_height * threshold_percentage
-    horizontal_threshold_distance = bbox.width * threshold_percentage
+def describe_images(image_contents):
+    """Describe many images concurrently; descriptions are returned in input order."""
+    return get_vlm_client().map(describe_image, image_contents)
+
+def describe_graphs(image_contents):
+    """Run is_graph and process_graph on many images concurrently; non-graphs get " ", in input order."""
+    def describe(image_content):
+        return process_graph(image_content) if is_graph(image_content) else " "
+    return get_vlm_client().map(describe, image_contents)
+
+class TextBlockIndex:
+    """Text blocks of one page sorted by their bottom and top edges, remembering their reading-order position."""
+
+    def __init__(self, text_blocks):
+        by_bottom = sorted(enumerate(text_blocks), key=lambda item: item[1][3])
+        self.bottoms = [block[3] for _, block in by_bottom]
+        self.by_bottom = by_bottom
+        by_top = sorted(enumerate(text_blocks), key=lambda item: item[1][1])
+        self.tops = [block[1] for _, block in by_top]
+        self.by_top = by_top
+
+    def first_above(self, bbox, max_distance):
+        """(position, block) of the earliest block in reading order ending above bbox within max_distance."""
+        start = bisect_left(self.bottoms, bbox.y0 - max_distance)
+        end = bisect_left(self.bottoms, bbox.y0)
+        return min(self.by_bottom[start:end], default=None, key=lambda item: item[0])
+
+    def first_below(self, bbox, max_distance):
+        """(position, block) of the earliest block in reading order starting below bbox within max_distance."""
+        start = bisect_right(self.tops, bbox.y1)
+        end = bisect_right(self.tops, bbox.y1 + max_distance)
+        return min(self.by_top[start:end], default=None, key=lambda item: item[0])
 
-    for block in text_blocks:
-        block_bbox = fitz.Rect(block[:4])
-        vertical_distance = min(abs(block_bbox.y1 - bbox.y0), abs(block_bbox.y0 - bbox.y1))
-        horizontal_overlap = max(0, min(block_bbox.x1, bbox.x1) - max(block_bbox.x0, bbox.x0))
+def extract_text_around_item(text_blocks, bbox, page_height, threshold_percentage=0.1):
+    """Extract text above and below a given bounding box on a page.
 
-        if vertical_distance <= vertical_threshold_distance and horizontal_overlap >= -horizontal_threshold_distance:
-            if block_bbox.y1 < bbox.y0 and not before_text:
-                before_text = block[4]
-            elif block_bbox.y0 > bbox.y1 and not after_text:
-                after_text = block[4]
-                break
+    Picks the first block in reading order above and below the item, as a scan over
+    text_blocks would; text_blocks may be a prebuilt TextBlockIndex, so a page with many
+    tables and images sorts its blocks once.
+    """
+    index = text_blocks if isinstance(text_blocks, TextBlockIndex) else TextBlockIndex(text_blocks)
+    vertical_threshold_distance = page_height * threshold_percentage
 
+    before = index.first_above(bbox, vertical_threshold_distance)
+    after = index.first_below(bbox, vertical_threshold_distance)
+    # The scan stopped at the first block below, so blocks above that come later in reading order were never reached
+    if before is not None and after is not None and before[0] > after[0]:
+        before = None
+    before_text = before[1][4] if before else ""
+    after_text = after[1][4] if after else ""
     return before_text, after_text
 
 def process_text_blocks(text_blocks, char_count_threshold=500):
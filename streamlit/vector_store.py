@@ -0,0 +1,576 @@
+import fcntl
+import json
+import os
+import random
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from file_utils import atomic_write, atomic_write_json
+
+# Local index configuration
+LOCAL_INDEX_DIR = os.getenv("RAG_LOCAL_INDEX_DIR", os.path.join(os.getcwd(), "vectorstore", "local_index"))
+LOCAL_INDEX_MODE = os.getenv("RAG_LOCAL_INDEX_MODE", "auto")  # exact, ivf or auto
+IVF_MIN_VECTORS = int(os.getenv("RAG_IVF_MIN_VECTORS", 50000))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", 8))
+# Filter masks kept per namespace; each costs one byte per vector
+FILTER_MASK_CACHE_SIZE = int(os.getenv("RAG_FILTER_MASK_CACHE_SIZE", 16))
+
+# Bulk upsert configuration; Pinecone caps requests at 1000 vectors and 2 MB
+UPSERT_BATCH_SIZE = int(os.getenv("RAG_UPSERT_BATCH_SIZE", 100))
+UPSERT_MAX_BATCH_BYTES = int(os.getenv("RAG_UPSERT_MAX_BATCH_BYTES", 1_500_000))
+UPSERT_MAX_WORKERS = int(os.getenv("RAG_UPSERT_MAX_WORKERS", 4))
+UPSERT_MAX_RETRIES = int(os.getenv("RAG_UPSERT_MAX_RETRIES", 3))
+
+_DEFAULT_NAMESPACE_DIR = "__default__"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _matches_filter(metadata, metadata_filter):
+    """Evaluates the subset of the Pinecone metadata filter language used by this project."""
+    for key, condition in metadata_filter.items():
+        if key == "$and":
+            if not all(_matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+            if op not in ("$eq", "$ne", "$in", "$nin"):
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return True
+
+
+def _filtered_document_ids(metadata_filter):
+    """Returns the document ids a filter selects if it only constrains document_id with $eq or $in, else None."""
+    if list(metadata_filter) != ["document_id"]:
+        return None
+    condition = metadata_filter["document_id"]
+    if not isinstance(condition, dict):
+        return [condition]
+    if list(condition) == ["$eq"]:
+        return [condition["$eq"]]
+    if list(condition) == ["$in"]:
+        return list(condition["$in"])
+    return None
+
+
+def _kmeans(vectors, n_clusters, iterations=10, seed=0):
+    """Spherical k-means on unit vectors; returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_clusters * 64)
+    sample = np.asarray(vectors[rng.choice(len(vectors), sample_size, replace=False)], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = sample[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids
+
+
+class _Partition:
+    """Vectors, ids and metadata of one namespace, persisted as memory-mapped .npy files.
+
+    Several processes may open the same partition. Each one re-reads the files when another
+    has saved since it loaded them, and save() replays this process's unsaved upserts and
+    deletes onto the latest files under an exclusive file lock, so concurrent writers merge
+    instead of overwriting each other.
+    """
+
+    def __init__(self, directory, dimension):
+        self.directory = directory
+        self.dimension = dimension
+        # Upserts and deletes since the last save, replayed onto the files other processes wrote
+        self._unsaved_upserts = {}
+        self._unsaved_deletes = set()
+        self._reset()
+        with self._locked(fcntl.LOCK_SH):
+            self._load()
+
+    def _reset(self):
+        self.vectors = np.empty((0, self.dimension), dtype=np.float32)
+        self.ids = []
+        self.metadata = []
+        self.id_to_row = {}
+        self.pending = {}
+        self.centroids = None
+        self.assignments = None
+        self.trained_size = 0
+        self._lists = None
+        self._filter_masks = OrderedDict()
+        self._document_rows = None
+        self.dirty = False
+        self._loaded_version = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _version(self):
+        """Identifies the saved state; records.json is replaced last by every save."""
+        try:
+            stat = os.stat(self._path("records.json"))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    @contextmanager
+    def _locked(self, mode):
+        """Holds a lock shared by every process using this partition (LOCK_SH to read, LOCK_EX to save)."""
+        if mode == fcntl.LOCK_SH and not os.path.isdir(self.directory):
+            yield  # nothing saved yet; don't create a directory for a namespace that may never be written
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        self._loaded_version = self._version()
+        if self._loaded_version is None or not os.path.exists(self._path("vectors.npy")):
+            return
+        # mmap_mode lets every worker process share the same page cache instead of copying
+        self.vectors = np.load(self._path("vectors.npy"), mmap_mode="r")
+        with open(self._path("records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self.ids = records["ids"]
+        self.metadata = records["metadata"]
+        self.trained_size = records.get("trained_size", 0)
+        self.id_to_row = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        if os.path.exists(self._path("ivf_centroids.npy")):
+            self.centroids = np.load(self._path("ivf_centroids.npy"))
+            self.assignments = np.load(self._path("ivf_assignments.npy"), mmap_mode="r")
+
+    def refresh(self, locked=False):
+        """Re-reads the files if another process saved since they were loaded, keeping unsaved changes."""
+        if self._version() == self._loaded_version:
+            return
+        self._reset()
+        if locked:
+            self._load()
+        else:
+            with self._locked(fcntl.LOCK_SH):
+                self._load()
+        if self._unsaved_deletes:
+            self._drop(self._unsaved_deletes)
+        self.pending = dict(self._unsaved_upserts)
+        self.dirty = bool(self._unsaved_upserts or self._unsaved_deletes)
+
+    def __len__(self):
+        return len(self.ids) + sum(1 for vector_id in self.pending if vector_id not in self.id_to_row)
+
+    def add(self, vector_id, values, metadata):
+        self.pending[vector_id] = (values, metadata or {})
+        self._unsaved_upserts[vector_id] = self.pending[vector_id]
+        self._unsaved_deletes.discard(vector_id)
+        self.dirty = True
+
+    def delete(self, ids):
+        ids = set(ids)
+        for vector_id in ids:
+            self._unsaved_upserts.pop(vector_id, None)
+        self._unsaved_deletes.update(ids)
+        self._drop(ids)
+
+    def _drop(self, ids):
+        self.consolidate()
+        keep = [row for row, vector_id in enumerate(self.ids) if vector_id not in ids]
+        self.vectors = np.ascontiguousarray(self.vectors[keep])
+        self.ids = [self.ids[row] for row in keep]
+        self.metadata = [self.metadata[row] for row in keep]
+        self.id_to_row = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        self.centroids, self.assignments, self._lists, self.trained_size = None, None, None, 0
+        self._filter_masks.clear()
+        self._document_rows = None
+        self.dirty = True
+
+    def consolidate(self):
+        """Folds pending upserts into the vector matrix in one copy."""
+        if not self.pending:
+            return
+        updates = {}
+        new_ids, new_rows, new_metadata = [], [], []
+        for vector_id, (values, metadata) in self.pending.items():
+            if vector_id in self.id_to_row:
+                updates[self.id_to_row[vector_id]] = (values, metadata)
+            else:
+                new_ids.append(vector_id)
+                new_rows.append(values)
+                new_metadata.append(metadata)
+        self.pending = {}
+
+        vectors = np.asarray(self.vectors, dtype=np.float32)
+        if updates:
+            vectors = np.array(vectors)  # copy out of the read-only memory map
+            for row, (values, metadata) in updates.items():
+                vectors[row] = values
+                self.metadata[row] = metadata
+        if new_rows:
+            vectors = np.concatenate([vectors, np.asarray(new_rows, dtype=np.float32)])
+            for vector_id in new_ids:
+                self.id_to_row[vector_id] = len(self.ids)
+                self.ids.append(vector_id)
+            self.metadata.extend(new_metadata)
+        self.vectors = vectors
+        self._filter_masks.clear()
+        if updates:
+            self._document_rows = None  # an update may move a row to another document
+        elif self._document_rows is not None:
+            for row in range(len(self.ids) - len(new_rows), len(self.ids)):
+                self._document_rows.setdefault(self.metadata[row].get("document_id"), []).append(row)
+
+        if self.centroids is not None:
+            if updates or len(self.ids) >= 2 * self.trained_size:
+                self.centroids, self.assignments, self._lists, self.trained_size = None, None, None, 0
+            elif new_rows:
+                tail = self.vectors[len(self.ids) - len(new_rows):]
+                self.assignments = np.concatenate(
+                    [np.asarray(self.assignments), np.argmax(tail @ self.centroids.T, axis=1).astype(np.int32)]
+                )
+                self._lists = None
+
+    def train_ivf(self):
+        n_clusters = int(min(4096, len(self.ids), max(8, np.sqrt(len(self.ids)))))
+        logging.info(f"Training IVF index with {n_clusters} lists over {len(self.ids)} vectors")
+        self.centroids = _kmeans(self.vectors, n_clusters)
+        assignments = np.empty(len(self.ids), dtype=np.int32)
+        for start in range(0, len(self.ids), 65536):
+            block = np.asarray(self.vectors[start:start + 65536])
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        self.assignments = assignments
+        self.trained_size = len(self.ids)
+        self._lists = None
+        self.dirty = True
+
+    def inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            offsets = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    def document_rows(self):
+        """Returns {document_id: rows}, built in one pass and extended as rows are appended."""
+        if self._document_rows is None:
+            self._document_rows = {}
+            for row, metadata in enumerate(self.metadata):
+                self._document_rows.setdefault(metadata.get("document_id"), []).append(row)
+        return self._document_rows
+
+    def filter_mask(self, metadata_filter):
+        key = json.dumps(metadata_filter, sort_keys=True)
+        mask = self._filter_masks.get(key)
+        if mask is not None:
+            self._filter_masks.move_to_end(key)
+            return mask
+        document_ids = _filtered_document_ids(metadata_filter)
+        if document_ids is not None:
+            # Scoped queries only filter on document_id, so their rows come straight from the map
+            mask = np.zeros(len(self.ids), dtype=bool)
+            rows = self.document_rows()
+            for document_id in document_ids:
+                mask[rows.get(document_id, [])] = True
+        else:
+            mask = np.fromiter(
+                (_matches_filter(metadata, metadata_filter) for metadata in self.metadata),
+                dtype=bool, count=len(self.metadata)
+            )
+        self._filter_masks[key] = mask
+        while len(self._filter_masks) > FILTER_MASK_CACHE_SIZE:
+            self._filter_masks.popitem(last=False)
+        return mask
+
+    def save(self):
+        if not self.dirty:
+            return
+        with self._locked(fcntl.LOCK_EX):
+            self.refresh(locked=True)
+            self._write()
+        self._unsaved_upserts = {}
+        self._unsaved_deletes = set()
+
+    def _write(self):
+        self.consolidate()
+        arrays = {"vectors.npy": self.vectors}
+        if self.centroids is not None:
+            arrays["ivf_centroids.npy"] = self.centroids
+            arrays["ivf_assignments.npy"] = np.asarray(self.assignments)
+        for name, array in arrays.items():
+            def write(tmp_path, array=array):
+                with open(tmp_path, "wb") as f:
+                    np.save(f, np.ascontiguousarray(array, dtype=array.dtype))
+            atomic_write(self._path(name), write)
+        if self.centroids is None:
+            for name in ("ivf_centroids.npy", "ivf_assignments.npy"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+        atomic_write_json(self._path("records.json"), {"ids": self.ids, "metadata": self.metadata, "trained_size": self.trained_size})
+        self.vectors = np.load(self._path("vectors.npy"), mmap_mode="r")
+        if self.centroids is not None:
+            self.assignments = np.load(self._path("ivf_assignments.npy"), mmap_mode="r")
+        self._loaded_version = self._version()
+        self.dirty = False
+
+
+class LocalVectorIndex:
+    """In-process vector index exposing the upsert/query/delete surface of a Pinecone index.
+
+    Small namespaces are searched exactly with one matrix product; namespaces with at least
+    ivf_min_vectors vectors switch to an inverted-file (IVF) search over nprobe clusters when
+    mode is "ivf" or "auto".
+    """
+
+    def __init__(self, name, dimension=384, metric="cosine", directory=None,
+                 mode=LOCAL_INDEX_MODE, ivf_min_vectors=IVF_MIN_VECTORS, nprobe=IVF_NPROBE):
+        if metric not in ("cosine", "dotproduct"):
+            raise ValueError(f"Unsupported metric for local index: {metric}")
+        if mode not in ("exact", "ivf", "auto"):
+            raise ValueError(f"Unsupported local index mode: {mode}")
+        self.name = name
+        self.dimension = dimension
+        self.metric = metric
+        self.directory = directory if directory is not None else os.path.join(LOCAL_INDEX_DIR, name)
+        self.mode = mode
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self._partitions = {}
+        self._lock = threading.RLock()
+
+    def _partition(self, namespace):
+        namespace = namespace or ""
+        if namespace not in self._partitions:
+            subdir = namespace if namespace else _DEFAULT_NAMESPACE_DIR
+            self._partitions[namespace] = _Partition(os.path.join(self.directory, subdir), self.dimension)
+        partition = self._partitions[namespace]
+        partition.refresh()
+        return partition
+
+    def _prepare(self, values):
+        vector = np.asarray(values, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dimension:
+            raise ValueError(f"Vector dimension {vector.shape[0]} does not match index dimension {self.dimension}")
+        if self.metric == "cosine":
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+        return vector
+
+    def upsert(self, vectors, namespace=""):
+        """Inserts or overwrites vectors given as dicts or (id, values, metadata) tuples."""
+        with self._lock:
+            partition = self._partition(namespace)
+            for record in vectors:
+                if isinstance(record, dict):
+                    vector_id, values, metadata = record["id"], record["values"], record.get("metadata")
+                else:
+                    vector_id, values = record[0], record[1]
+                    metadata = record[2] if len(record) > 2 else None
+                partition.add(vector_id, self._prepare(values), metadata)
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, namespace=""):
+        with self._lock:
+            partition = self._partition(namespace)
+            partition.consolidate()
+            if not partition.ids:
+                return {"matches": [], "namespace": namespace}
+            query_vector = self._prepare(vector)
+            use_ivf = self.mode == "ivf" or (self.mode == "auto" and len(partition.ids) >= self.ivf_min_vectors)
+            if use_ivf and partition.centroids is None:
+                partition.train_ivf()
+            mask = partition.filter_mask(filter) if filter else None
+
+            rows = None
+            if use_ivf:
+                order, offsets = partition.inverted_lists()
+                probe = np.argsort(-(partition.centroids @ query_vector))[:self.nprobe]
+                rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                if len(rows) < top_k:
+                    rows = None  # too few candidates in the probed lists, fall back to exact search
+            if rows is None:
+                rows = np.flatnonzero(mask) if mask is not None else np.arange(len(partition.ids))
+            if not len(rows):
+                return {"matches": [], "namespace": namespace}
+
+            # Probed inverted lists arrive in cluster order; ascending rows keep positions aligned with
+            # rows and memory-mapped reads sequential
+            rows = np.sort(rows)
+            if len(rows) == len(partition.ids):
+                candidates = partition.vectors  # rows are unique, so a full set is exactly arange
+            else:
+                candidates = partition.vectors[rows]
+            scores = np.asarray(candidates @ query_vector)
+            k = min(top_k, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+
+            matches = []
+            for position in best:
+                row = int(rows[position])
+                match = {"id": partition.ids[row], "score": float(scores[position])}
+                if include_metadata:
+                    match["metadata"] = partition.metadata[row]
+                if include_values:
+                    match["values"] = np.asarray(partition.vectors[row]).tolist()
+                matches.append(match)
+            return {"matches": matches, "namespace": namespace}
+
+    def fetch(self, ids, namespace=""):
+        with self._lock:
+            partition = self._partition(namespace)
+            partition.consolidate()
+            return {"vectors": {
+                vector_id: {
+                    "id": vector_id,
+                    "values": np.asarray(partition.vectors[partition.id_to_row[vector_id]]).tolist(),
+                    "metadata": partition.metadata[partition.id_to_row[vector_id]],
+                }
+                for vector_id in ids if vector_id in partition.id_to_row
+            }}
+
+    def delete(self, ids=None, delete_all=False, namespace=""):
+        with self._lock:
+            partition = self._partition(namespace)
+            if delete_all:
+                partition.delete(list(partition.ids) + list(partition.pending))
+            elif ids:
+                partition.delete(ids)
+        return {}
+
+    def describe_index_stats(self):
+        with self._lock:
+            if os.path.isdir(self.directory):
+                for subdir in os.listdir(self.directory):
+                    self._partition("" if subdir == _DEFAULT_NAMESPACE_DIR else subdir)
+            namespaces = {namespace: {"vector_count": len(partition)} for namespace, partition in self._partitions.items()}
+            return {
+                "dimension": self.dimension,
+                "namespaces": namespaces,
+                "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values()),
+            }
+
+    def flush(self):
+        """Persists pending changes and re-maps the vector files read-only."""
+        with self._lock:
+            for partition in self._partitions.values():
+                partition.save()
+
+
+_local_indexes = {}
+_local_indexes_lock = threading.Lock()
+
+
+def open_local_index(name, dimension=384, metric="cosine"):
+    """Returns the process-wide LocalVectorIndex for name, creating it on first use."""
+    with _local_indexes_lock:
+        if name not in _local_indexes:
+            _local_indexes[name] = LocalVectorIndex(name, dimension=dimension, metric=metric)
+        return _local_indexes[name]
+
+
+def _estimate_record_bytes(record):
+    """Request size of one record as it is serialized to JSON (float32 values take ~22 bytes each)."""
+    if isinstance(record, dict):
+        record_id, values, metadata = record["id"], record["values"], record.get("metadata") or {}
+    else:
+        record_id, values, metadata = record[0], record[1], (record[2] if len(record) > 2 else None) or {}
+    values = values.tolist() if hasattr(values, "tolist") else values
+    return len(json.dumps({"id": record_id, "values": values, "metadata": metadata})) + 16
+
+
+def batch_records(records, max_count=UPSERT_BATCH_SIZE, max_bytes=UPSERT_MAX_BATCH_BYTES):
+    """Splits records into batches bounded by both record count and estimated payload size."""
+    batch, batch_bytes = [], 0
+    for record in records:
+        record_bytes = _estimate_record_bytes(record)
+        if batch and (len(batch) >= max_count or batch_bytes + record_bytes > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(record)
+        batch_bytes += record_bytes
+    if batch:
+        yield batch
+
+
+def _upsert_with_retry(index, batch, namespace, max_retries, backoff_seconds):
+    for attempt in range(max_retries + 1):
+        try:
+            if namespace is None:
+                index.upsert(vectors=batch)
+            else:
+                index.upsert(vectors=batch, namespace=namespace)
+            return len(batch)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_seconds * (2 ** attempt) * (1 + random.random())
+            logging.warning(f"Upsert of {len(batch)} vectors failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def bulk_upsert(index, records, namespace=None, batch_size=UPSERT_BATCH_SIZE,
+                max_batch_bytes=UPSERT_MAX_BATCH_BYTES, max_workers=UPSERT_MAX_WORKERS,
+                max_retries=UPSERT_MAX_RETRIES, backoff_seconds=0.5):
+    """Upserts records in size-bounded batches with bounded parallelism and per-batch retries.
+
+    Returns a stats dict with counts, elapsed seconds and vectors/sec. Raises RuntimeError
+    if any batch still fails after max_retries, so callers never record a partial ingest
+    as complete.
+    """
+    start = time.perf_counter()
+    batches = list(batch_records(records, batch_size, max_batch_bytes))
+    upserted, failures = 0, []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches) or 1))) as executor:
+        futures = [
+            executor.submit(_upsert_with_retry, index, batch, namespace, max_retries, backoff_seconds)
+            for batch in batches
+        ]
+        for future in as_completed(futures):
+            try:
+                upserted += future.result()
+            except Exception as e:
+                failures.append(e)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "upserted": upserted,
+        "batches": len(batches),
+        "failed_batches": len(failures),
+        "seconds": elapsed,
+        "vectors_per_second": upserted / elapsed if elapsed > 0 else 0.0,
+    }
+    logging.info(
+        f"Upserted {upserted} vectors in {len(batches)} batches "
+        f"({stats['vectors_per_second']:.0f} vectors/s, {len(failures)} failed batches)"
+    )
+    if failures:
+        raise RuntimeError(f"{len(failures)} of {len(batches)} upsert batches failed: {failures[0]}")
+    return stats
@@ -0,0 +1,98 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+from file_utils import atomic_write_bytes
+
+# On-disk cache of VLM/LLM responses keyed by image content, model and prompt
+VLM_CACHE_DIR = os.getenv("VLM_CACHE_DIR", os.path.join(os.getcwd(), "vectorstore", "vlm_cache"))
+VLM_CACHE_MAX_BYTES = int(os.getenv("VLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+_lock = threading.Lock()
+_cache_bytes = None  # lazily measured size of the cache directory
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def cache_key(image_content, model, prompt):
+    image_hash = hashlib.sha256(image_content).hexdigest()
+    return hashlib.sha256(f"{model}\0{prompt}\0{image_hash}".encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(VLM_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _entries():
+    for shard in os.scandir(VLM_CACHE_DIR):
+        if shard.is_dir():
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    yield entry
+
+
+def get(image_content, model, prompt):
+    """Returns the cached response for this image, model and prompt, or None."""
+    path = _entry_path(cache_key(image_content, model, prompt))
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)["result"]
+        os.utime(path)  # mtime doubles as the LRU timestamp for eviction
+    except (OSError, ValueError, KeyError):
+        stats["misses"] += 1
+        return None
+    stats["hits"] += 1
+    return result
+
+
+def put(image_content, model, prompt, result):
+    global _cache_bytes
+    path = _entry_path(cache_key(image_content, model, prompt))
+    payload = json.dumps({"model": model, "prompt": prompt, "result": result}).encode("utf-8")
+    atomic_write_bytes(path, payload)
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(entry.stat().st_size for entry in _entries())
+        else:
+            _cache_bytes += len(payload)
+        if _cache_bytes > VLM_CACHE_MAX_BYTES:
+            _evict()
+
+
+def _evict():
+    """Deletes least recently used entries until the cache is at 90% of its size limit."""
+    global _cache_bytes
+    entries = []
+    for entry in _entries():
+        try:
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            continue  # removed concurrently by another process
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    target = VLM_CACHE_MAX_BYTES * 0.9
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            stats["evictions"] += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    _cache_bytes = total
+
+
+def cached_vlm_call(model, prompt):
+    """Decorates fn(image_content) so each unique image is sent to model with prompt at most once."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(image_content):
+            result = get(image_content, model, prompt)
+            if result is None:
+                result = fn(image_content)
+                put(image_content, model, prompt, result)
+            return result
+        return wrapper
+    return decorator
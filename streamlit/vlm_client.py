@@ -0,0 +1,134 @@
+import os
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# NVIDIA VLM endpoint configuration; point VLM_BASE_URL at a local stub server in tests
+VLM_BASE_URL = os.getenv("VLM_BASE_URL", "https://ai.api.nvidia.com/v1/vlm")
+VLM_MAX_IN_FLIGHT = int(os.getenv("VLM_MAX_IN_FLIGHT", 4))
+VLM_RATE_PER_SECOND = float(os.getenv("VLM_RATE_PER_SECOND", 2))
+VLM_TIMEOUT = float(os.getenv("VLM_TIMEOUT", 60))
+VLM_MAX_RETRIES = int(os.getenv("VLM_MAX_RETRIES", 3))
+
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class VLMClient:
+    """Shared client for the NVIDIA VLM API with pooled keep-alive connections,
+    bounded in-flight requests, client-side rate limiting and jittered retries."""
+
+    def __init__(self, base_url=VLM_BASE_URL, api_key=None, max_in_flight=VLM_MAX_IN_FLIGHT,
+                 rate_per_second=VLM_RATE_PER_SECOND, timeout=VLM_TIMEOUT, max_retries=VLM_MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._bucket = TokenBucket(rate_per_second)
+
+    def _headers(self):
+        api_key = self.api_key or os.getenv("NVIDIA_API_KEY")
+        if not api_key:
+            raise ValueError("NVIDIA API Key is not set. Please set the NVIDIA_API_KEY environment variable.")
+        return {"Authorization": f"Bearer {api_key}", "Accept": "application/json"}
+
+    def complete(self, model, content, **params):
+        """Sends one user message to model and returns the text of the first choice."""
+        payload = {"messages": [{"role": "user", "content": content}], "stream": False, **params}
+        url = f"{self.base_url}/{model}"
+        headers = self._headers()
+        for attempt in range(self.max_retries + 1):
+            self._bucket.acquire()
+            try:
+                with self._in_flight:
+                    response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+                if response.status_code not in _RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()["choices"][0]["message"]["content"]
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, retry_after = str(e), None
+            if attempt == self.max_retries:
+                raise RuntimeError(f"VLM request to {model} failed after {attempt + 1} attempts: {error}")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 0.5 * 2 ** attempt
+            delay *= 1 + random.random()  # jitter so concurrent workers do not retry in lockstep
+            logging.warning(f"VLM request to {model} failed ({error}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def map(self, fn, items):
+        """Applies fn to items with up to max_in_flight concurrent calls; results keep input order."""
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(items))) as executor:
+            return list(executor.map(fn, items))
+
+
+_client = None
+_client_lock = threading.Lock()
+_budget_share = 1  # number of processes splitting VLM_MAX_IN_FLIGHT and VLM_RATE_PER_SECOND
+
+
+def get_vlm_client():
+    """Returns the process-wide VLMClient."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = VLMClient(
+                max_in_flight=max(1, VLM_MAX_IN_FLIGHT // _budget_share),
+                rate_per_second=VLM_RATE_PER_SECOND / _budget_share,
+            )
+        return _client
+
+
+def share_budget(processes):
+    """Gives this process 1/processes of the in-flight and rate budget; called in each pool worker."""
+    global _client, _budget_share
+    with _client_lock:
+        _budget_share = max(1, processes)
+        _client = None
+
+
+def _reset_after_fork():
+    # A forked child must not reuse the parent's pooled sockets: responses would interleave
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)